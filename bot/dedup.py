@@ -0,0 +1,108 @@
+import os
+import re
+import base64
+import logging
+from database.mongo import db
+from downloader.selection import file_episode
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# CONTENT KEYS
+# =========================
+
+def infohash_from_magnet(link):
+    """magnet:?xt=urn:btih:<hex or base32> -> lowercase hex infohash."""
+    match = re.search(r"xt=urn:btih:([a-zA-Z0-9]+)", link or "")
+    if not match:
+        return None
+    h = match.group(1)
+    if len(h) == 32:
+        try:
+            h = base64.b32decode(h.upper()).hex()
+        except Exception:
+            return None
+    return h.lower() if len(h) == 40 else None
+
+def link_keys(link, info_hash=None):
+    """Same torrent = same content, whichever magnet/tracker list it came with."""
+    info_hash = (info_hash or infohash_from_magnet(link) or "").lower()
+    if info_hash:
+        return [f"btih:{info_hash}"]
+    return [f"url:{link}"] if link else []
+
+def episode_key(ep_url, variant):
+    return f"episode:{ep_url.rstrip('/')}|{variant or 'default'}"
+
+def release_key(fname):
+    """
+    '[Group] Anime - 12 [1080p]_muxed.mkv' -> 'release:group anime 12 1080p'.
+    Only names that identify a release (a [Group] tag and an episode number)
+    get a key; our own output names ('stream.mp4', 'EP 1.mp4') return None.
+    """
+    name = os.path.splitext(os.path.basename(fname))[0]
+    name = re.sub(r"_muxed$", "", name)
+    if not re.match(r"\s*\[[^\]]+\]", name) or file_episode(name) is None:
+        return None
+    name = " ".join(re.sub(r"[^0-9a-z]+", " ", name.lower()).split())
+    return f"release:{name}" if name else None
+
+
+# =========================
+# UPLOAD INDEX
+# =========================
+
+class UploadIndex:
+    """
+    Everything we ever posted to CHANNEL_ID, keyed by infohash, source
+    episode URL and release name. A repeat request is answered by copying
+    the old post back into the channel (or re-sending its file_id) instead
+    of download + mux + upload.
+    """
+
+    async def lookup(self, keys):
+        keys = [k for k in keys if k]
+        entry = await db.get_upload(keys)
+        return entry if entry and entry.get("files") else None
+
+    async def record(self, keys, files):
+        """files: [{"message_id", "file_id", "fname", "size"}] in posting order."""
+        keys = [k for k in keys if k]
+        if files:
+            await db.set_upload(keys, files)
+
+    async def deliver(self, bot, entry, keys=()):
+        """Re-post a cached upload to CHANNEL_ID. Returns the files delivered (empty -> download it)."""
+        sent = []
+        for f in entry["files"]:
+            try:
+                await bot.copy_message(Config.CHANNEL_ID, Config.CHANNEL_ID, f["message_id"])
+            except Exception:
+                # Original post deleted? The file_id itself still works.
+                try:
+                    await bot.send_document(
+                        Config.CHANNEL_ID, document=f["file_id"], caption=f"📂 `{f['fname']}`", parse_mode="Markdown"
+                    )
+                except Exception as e:
+                    logger.warning(f"Cached upload {f['fname']} is gone: {e}")
+                    continue
+            sent.append(f)
+
+        if not sent:
+            await db.delete_upload([k for k in keys if k])
+        return sent
+
+
+def sent_file(sent_msg, fname, size):
+    """Telegram Message from send_document -> the record kept in the index."""
+    return {
+        "message_id": sent_msg.message_id,
+        "file_id": sent_msg.document.file_id if sent_msg.document else None,
+        "fname": fname,
+        "size": size
+    }
+
+
+upload_index = UploadIndex()
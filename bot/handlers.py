@@ -12,12 +12,25 @@ from scrapers.common_scraper import CommonAnimeScraper
 from scrapers.gogoanime3 import scrape_gogoanime
 from scrapers.animixplay import scrape_animixplay
 from scrapers.allanime import IntelligentScraper 
+from scrapers.search import SearchOrchestrator, search_cache
+from scrapers.episodes import episode_index
+from scrapers.link_cache import link_cache
+from scrapers.site_health import site_health
 
 # --- CORE IMPORTS ---
 from downloader.torrent import TorrentDownloader
+from downloader.http_direct import classify_link
+from downloader.selection import parse_range
+from downloader.admission import disk_admission, DiskFullError
+from processor.muxer import mux_subtitles, cancel_mux, MuxCancelled
 from database.mongo import db
 from config import Config
 from utils.memory_manager import start_memory_manager
+from utils.safe_browser import block_stats
+from bot.pipeline import StagedPipeline
+from bot.jobs import job_queue
+from bot.dedup import upload_index, link_keys, episode_key, release_key, sent_file
+from utils.browser_state import session_store
 
 # --- LOGGING ---
 logging.basicConfig(
@@ -54,14 +67,13 @@ async def async_delete(path):
     except Exception as e:
         logger.warning(f"Failed to delete {path}: {e}")
 
-async def send_error_log(update, context, error_msg):
+async def send_error_log(bot, chat_id, error_msg):
     try:
         log_content = f"⚠️ Error:\n{error_msg}\n\nTrace:\n{traceback.format_exc()}"
         with open("error_log.txt", "w", encoding="utf-8") as f:
             f.write(log_content)
-        chat_id = update.effective_chat.id if update.effective_chat else Config.CHANNEL_ID
         with open("error_log.txt", "rb") as f:
-            await context.bot.send_document(chat_id=chat_id, document=f, caption="⚠️ **Error Log**")
+            await bot.send_document(chat_id=chat_id or Config.CHANNEL_ID, document=f, caption="⚠️ **Error Log**")
         await async_delete("error_log.txt")
     except Exception as e:
         logger.warning(f"Failed to send error log: {e}")
@@ -80,14 +92,35 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ram = psutil.virtual_memory()
     total_users = await db.get_total_users()
     down, up = await db.get_total_traffic()
+    blocked = block_stats.snapshot()
+    sessions = session_store.snapshot()
+    disk = disk_admission.snapshot()
     
     text = (
         f"📊 **Status**\n"
         f"**CPU**: `{cpu}%` | **RAM**: `{ram.percent}%`\n"
         f"**Jobs**: `{JOBS_PROCESSED}/{Config.WORKER_TTL}`\n"
         f"**Users**: `{total_users}`\n"
-        f"**Traffic**: ⬇️ `{human_readable_size(down)}` | ⬆️ `{human_readable_size(up)}`"
+        f"**Traffic**: ⬇️ `{human_readable_size(down)}` | ⬆️ `{human_readable_size(up)}`\n"
+        f"**Disk**: `{human_readable_size(disk['free'])}` free | `{human_readable_size(disk['reserved'])}` reserved\n"
+        f"**Blocked**: `{blocked['blocked']}` req (~`{blocked['est_seconds_saved']}s` saved)\n"
+        f"**Sessions**: `{sessions['reused']}` reused / `{sessions['challenges']}` challenged "
+        f"(~`{sessions['est_seconds_saved']}s` saved)"
     )
+
+    # Per-site scraper health
+    for name, h in site_health.snapshot().items():
+        block = f"{h['since_block'] // 60}m ago" if h['since_block'] is not None else "never"
+        state = "" if h['state'] == "closed" else f" | ⛔ {h['state']}"
+        text += (
+            f"\n🌐 **{name}**: `{h['success_rate']}%` | p50 `{h['p50']}s` p95 `{h['p95']}s` "
+            f"| 403/503 `{block}`{state}"
+        )
+
+    # Latest aria2 tuner decisions
+    for d in downloader.tuner.snapshot():
+        ago = int(time.time() - d["at"]) // 60
+        text += f"\n🎛️ `{d['target']}` {', '.join(f'{k}={v}' for k, v in d['options'].items())} ({ago}m ago): {d['reason']}"
     await msg.edit_text(text, parse_mode="Markdown")
 
 async def set_thumb_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -116,15 +149,224 @@ async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await status.edit_text(f"✅ **Done** ({success}/{total})", parse_mode="Markdown")
 
 # --- CORE LOGIC ---
-async def monitor_and_process_download(gid, update, context, status_msg):
+def collect_videos(base_path):
+    # Discover video files
+    video_files = []
+    if os.path.isfile(base_path): video_files.append(base_path)
+    else:
+        for r, _, f in os.walk(base_path):
+            for file in f:
+                if file.lower().endswith(('.mkv', '.mp4', '.avi')):
+                    video_files.append(os.path.join(r, file))
+    video_files.sort()
+    return video_files
+
+async def prepare_video(v_path, created_files, key=None, progress=None, subs=None):
+    """
+    Subtitle muxing (.srt, .vtt, .ass). Returns (final_path, fname).
+    `subs`: the subtitles selected for this video (best first); without
+    them only `<video name>.<ext>` next to the file is looked for.
+    `key` is the download GID its cancel button kills; MuxCancelled propagates.
+    """
+    fname = os.path.basename(v_path)
+    final_path = v_path
+
+    base = os.path.splitext(v_path)[0]
+    if subs is None:
+        subs = [base + ext for ext in [".srt", ".vtt", ".ass"]]
+    sub_path = next((s for s in subs if os.path.exists(s)), None)
+    if sub_path: created_files.append(sub_path)
+
+    if sub_path:
+        try:
+            out_muxed = base + "_muxed" + os.path.splitext(v_path)[1]
+            created_files.append(out_muxed)
+            ok, err = await mux_subtitles(v_path, sub_path, out_muxed, progress=progress, key=key)
+            if ok:
+                final_path = out_muxed
+                fname = os.path.basename(final_path)
+            else:
+                logger.warning(f"Muxing failed, uploading without subtitles: {err}")
+        except MuxCancelled:
+            raise
+        except Exception as e:
+            logger.warning(f"Muxing failed: {e}")
+    return final_path, fname
+
+async def upload_video(bot, final_path, fname, thumb_data, on_attempt=None):
+    """Upload with retries. Returns the sent message or None."""
+    for attempt in range(3):
+        try:
+            if on_attempt: await on_attempt(attempt)
+            with open(final_path, 'rb') as doc:
+                return await bot.send_document(
+                    Config.CHANNEL_ID, document=doc, caption=f"📂 `{fname}`",
+                    thumbnail=thumb_data, parse_mode="Markdown"
+                )
+        except tg_error.NetworkError:
+            await asyncio.sleep(2 * (attempt + 1))
+        except Exception as e:
+            logger.error(f"Upload Error: {e}")
+            break
+    return None
+
+async def upload_downloaded(base_path, user_id, bot, status_msg, created_files, video_files=None, key=None, by_release=True, subs=None):
+    """
+    Mux + upload every video under base_path, or exactly `video_files` when
+    aria2 already listed them (files already in the upload index are
+    re-posted instead). `subs` maps video path -> its selected subtitles.
+    `key` is the download GID, so Cancel also stops the mux.
+    `by_release=False` for files we named ourselves (HLS output).
+    Returns (found_any, last_anime, last_ep, files).
+    """
+    if video_files is None:
+        video_files = await asyncio.to_thread(collect_videos, base_path)
+    if not video_files:
+        return False, None, None, []
+
+    await status_msg.edit_text(f"Found {len(video_files)} files.")
+    thumb_data = await db.get_thumbnail(user_id)
+    last_anime, last_ep = None, None
+    files = []
+
+    for idx, v_path in enumerate(video_files):
+        rkey = release_key(v_path) if by_release else None
+        entry = await upload_index.lookup([rkey])
+        reused = await upload_index.deliver(bot, entry, [rkey]) if entry else []
+        if reused:
+            files += reused
+            anime, ep = await db.add_history(user_id, reused[-1]["fname"])
+            if anime: last_anime, last_ep = anime, ep
+            continue
+
+        async def on_mux(pct):
+            # Update progress sparingly to avoid ratelimit
+            if pct % 10 == 0:
+                await status_msg.edit_text(f"🎬 Muxing subtitles ({idx+1}/{len(video_files)}) | `{pct}%`", parse_mode="Markdown")
+
+        final_path, fname = await prepare_video(
+            v_path, created_files, key=key, progress=on_mux, subs=(subs or {}).get(v_path)
+        )
+
+        async def on_attempt(attempt):
+            await status_msg.edit_text(f"⬆️ Uploading ({idx+1}/{len(video_files)}) | Attempt {attempt+1}/3")
+
+        sent_msg = await upload_video(bot, final_path, fname, thumb_data, on_attempt)
+        if sent_msg:
+            files.append(sent_file(sent_msg, fname, os.path.getsize(final_path)))
+            await upload_index.record([rkey], files[-1:])
+            anime, ep = await db.add_history(user_id, fname)
+            if anime: last_anime, last_ep = anime, ep
+            await db.update_stats(user_id, os.path.getsize(final_path))
+
+            if idx == len(video_files) - 1 and len(video_files) > 1 and last_anime:
+                await db.delete_history(user_id, last_anime)
+
+    return True, last_anime, last_ep, files
+
+async def deliver_cached(keys, user_id, bot, status_msg):
+    """Answer a repeat request from the upload index. True if nothing needs downloading."""
+    entry = await upload_index.lookup(keys)
+    if not entry:
+        return False
+    sent = await upload_index.deliver(bot, entry, keys)
+    if not sent:
+        return False
+    for f in sent:
+        await db.add_history(user_id, f["fname"])
+    await status_msg.edit_text(f"⚡ **Already uploaded** - re-posted {len(sent)} file(s) instantly.", parse_mode="Markdown")
+    return True
+
+async def reserve_disk(file_size, label, status_msg=None, mux_copy=True):
+    """Admission control: wait until the disk can take the download (+ mux copy)."""
+    async def waiting(need, free):
+        try:
+            await status_msg.edit_text(
+                f"⏳ Waiting for disk space: need `{human_readable_size(need)}`, `{human_readable_size(free)}` available...",
+                parse_mode="Markdown"
+            )
+        except: pass
+
+    return await disk_admission.acquire(file_size, label, mux_copy=mux_copy, on_wait=waiting if status_msg else None)
+
+async def cancel_download(gid):
+    """Cancel button / worker cancel flag: stop the aria2 download and any mux of it."""
+    if cancel_mux(gid):
+        # Download already finished; the mux was all that was left
+        try: await downloader.remove_download(gid)
+        except: pass
+        return
+    await downloader.remove_download(gid)
+
+async def count_job():
+    """Returns True once this worker has reached WORKER_TTL."""
     global JOBS_PROCESSED
+    if Config.WORKER_TTL <= 0:
+        return False
+    async with JOB_LOCK:
+        JOBS_PROCESSED += 1
+        return JOBS_PROCESSED >= Config.WORKER_TTL
+
+async def maintenance_restart(status_msg):
+    # Worker Recycling
+    await status_msg.reply_text("♻️ **Maintenance Restart...**")
+    # Unfinished jobs are picked up again on the next boot
+    await job_queue.release()
+    await asyncio.sleep(2)
+    os._exit(0)
+
+async def finish_job(status_msg, last_anime, last_ep):
+    if await count_job():
+        await maintenance_restart(status_msg)
+
+    txt = "✅ **Done!**"
+    if last_anime: txt += f"\n📺 {last_anime} (Ep {last_ep})"
+    await status_msg.edit_text(txt, parse_mode="Markdown")
+
+async def monitor_and_process_download(gid, job, bot, status_msg, hold=None):
+    """hold: disk Reservation taken before add_torrent (direct links); torrents reserve here."""
     created_files = []
     base_path = None
+    state = "failed"
 
     try:
+        # Torrents: metadata first, then only the wanted files
+        if classify_link(job["link"]) in ("magnet", "torrent"):
+            await status_msg.edit_text("🧲 Fetching torrent metadata...")
+            payload = await downloader.wait_for_metadata(gid)
+            if not payload:
+                return await status_msg.edit_text("❌ Could not fetch torrent metadata.")
+            gid = payload
+            await job_queue.set_gid(job, 0, gid)
+
+        # A .torrent URL only reveals its infohash once aria2 has parsed it
+        # (a partial range / resumed pack is never served from or stored as the whole torrent)
+        whole = not job.get("ep_range") and not job["done"]
+        status = await downloader.get_status(gid)
+        if whole and status and status.get("info_hash"):
+            if await deliver_cached(link_keys(None, status["info_hash"]), job["user_id"], bot, status_msg):
+                state = "done"
+                return await downloader.remove_download(gid)
+
+        if classify_link(job["link"]) in ("magnet", "torrent"):
+            stream = await downloader.open_stream(gid, parse_range(job.get("ep_range")), skip=set(job["done"]))
+            if not stream:
+                await downloader.remove_download(gid)
+                return await status_msg.edit_text("⚠️ No matching video files in this torrent.")
+            try:
+                hold = await reserve_disk(stream.peak_bytes(), status["name"], status_msg, mux_copy=False)
+            except DiskFullError as e:
+                await downloader.remove_download(gid)
+                return await status_msg.edit_text(f"❌ Too big for this server: {e}")
+            state = await process_torrent_stream(stream, job, bot, status_msg, whole, status)
+            return
+
         cancel_btn = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_{gid}")]])
 
         async def progress_callback(status):
+            # Bytes already on disk no longer need reserving
+            if hold and status["total_length"]:
+                await hold.resize(2 * status["total_length"] - status["completed_length"])
             try:
                 # Update progress sparingly to avoid ratelimit
                 if int(float(status['progress'])) % 5 == 0:
@@ -135,140 +377,213 @@ async def monitor_and_process_download(gid, update, context, status_msg):
                     )
             except: pass
 
-        await downloader.wait_for_completion(gid, callback=progress_callback)
+        gid = await downloader.wait_for_completion(gid, callback=progress_callback)
+        await job_queue.set_gid(job, 0, gid)
         status = await downloader.get_status(gid)
 
         if status and status["status"] == "complete":
             await status_msg.edit_text("✅ Processing Files...")
             base_path = f"./downloads/{status['name']}"
             created_files.append(base_path)
-
-            # Discover video files
-            video_files = []
-            if os.path.isfile(base_path): video_files.append(base_path)
-            else:
-                for r, _, f in os.walk(base_path):
-                    for file in f:
-                        if file.lower().endswith(('.mkv', '.mp4', '.avi')):
-                            video_files.append(os.path.join(r, file))
-            video_files.sort()
-
-            if not video_files:
+            # Only the mux copy is still to be written
+            if hold: await hold.resize(status["total_length"])
+
+            subs = await downloader.downloaded_files(gid)
+            found, last_anime, last_ep, files = await upload_downloaded(
+                base_path, job["user_id"], bot, status_msg, created_files,
+                list(subs) if subs is not None else None, key=gid, subs=subs
+            )
+            await downloader.forget(gid)
+            if not found:
                 return await status_msg.edit_text("⚠️ No video files found.")
-
-            await status_msg.edit_text(f"Found {len(video_files)} files.")
-            thumb_data = await db.get_thumbnail(update.effective_user.id)
-            last_anime, last_ep = None, None
-
-            for idx, v_path in enumerate(video_files):
-                fname = os.path.basename(v_path)
-                final_path = v_path
-
-                # Subtitle muxing (.srt, .vtt, .ass)
-                base = os.path.splitext(v_path)[0]
-                sub_path = next((base + ext for ext in [".srt", ".vtt", ".ass"] if os.path.exists(base + ext)), None)
-                if sub_path: created_files.append(sub_path)
-
-                if sub_path:
-                    try:
-                        from processor.muxer import mux_subtitles
-                        out_muxed = base + "_muxed" + os.path.splitext(v_path)[1]
-                        created_files.append(out_muxed)
-                        if mux_subtitles(v_path, sub_path, out_muxed):
-                            final_path = out_muxed
-                            fname = os.path.basename(final_path)
-                    except Exception as e:
-                        logger.warning(f"Muxing failed: {e}")
-
-                # Upload with retries
-                sent_msg = None
-                for attempt in range(3):
-                    try:
-                        await status_msg.edit_text(f"⬆️ Uploading ({idx+1}/{len(video_files)}) | Attempt {attempt+1}/3")
-                        with open(final_path, 'rb') as doc:
-                            sent_msg = await context.bot.send_document(
-                                Config.CHANNEL_ID, document=doc, caption=f"📂 `{fname}`",
-                                thumbnail=thumb_data, parse_mode="Markdown"
-                            )
-                        break
-                    except tg_error.NetworkError:
-                        await asyncio.sleep(2 * (attempt + 1))
-                    except Exception as e:
-                        logger.error(f"Upload Error: {e}")
-                        break
-
-                if sent_msg:
-                    anime, ep = await db.add_history(update.effective_user.id, fname)
-                    if anime: last_anime, last_ep = anime, ep
-                    await db.update_stats(update.effective_user.id, os.path.getsize(final_path))
-
-                    if idx == len(video_files) - 1 and len(video_files) > 1 and last_anime:
-                        await db.delete_history(update.effective_user.id, last_anime)
-
-            # Worker Recycling
-            if Config.WORKER_TTL > 0:
-                async with JOB_LOCK:
-                    JOBS_PROCESSED += 1
-                    if JOBS_PROCESSED >= Config.WORKER_TTL:
-                        await status_msg.reply_text("♻️ **Maintenance Restart...**")
-                        await asyncio.sleep(2)
-                        os._exit(0)
-
-            txt = "✅ **Done!**"
-            if last_anime: txt += f"\n📺 {last_anime} (Ep {last_ep})"
-            await status_msg.edit_text(txt, parse_mode="Markdown")
+            if whole:
+                await upload_index.record(link_keys(job["link"]) + link_keys(None, status.get("info_hash")), files)
+            state = "done"
+            await job_queue.finish(job, state)
+            await finish_job(status_msg, last_anime, last_ep)
 
         elif status and status["status"] == "removed":
+            state = "cancelled"
             await status_msg.edit_text("❌ **Cancelled.**", parse_mode="Markdown")
         else:
             await status_msg.edit_text("❌ Download Failed.")
 
+    except MuxCancelled:
+        state = "cancelled"
+        await status_msg.edit_text("❌ **Cancelled.**", parse_mode="Markdown")
     except Exception as e:
-        await send_error_log(update, context, str(e))
+        await send_error_log(bot, job["chat_id"], str(e))
 
     finally:
+        await job_queue.finish(job, state)
+        await downloader.forget(gid)
+        if hold: await hold.release()
         # Non-blocking cleanup
         if base_path: await async_delete(base_path)
         for f in created_files: await async_delete(f)
 
+async def process_torrent_stream(stream, job, bot, status_msg, whole, status):
+    """
+    Season packs: each episode is muxed, uploaded and deleted as soon as its
+    own file completes, while aria2 fetches the next one. Returns the job state.
+    """
+    cancel_btn = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_{stream.gid}")]])
+    root = f"./downloads/{status['name']}" if status else None
+    files, last_anime, last_ep = [], None, None
+
+    async def progress(done, total, pct, speed):
+        try:
+            await status_msg.edit_text(
+                f"📥 Episode **{done + 1}/{total}**: `{pct}%`\n🚀 `{speed}`",
+                reply_markup=cancel_btn, parse_mode="Markdown"
+            )
+        except: pass
+
+    await status_msg.edit_text(f"📂 Streaming **{len(stream.groups)}** selected episodes...", parse_mode="Markdown")
+    try:
+        async for index, paths in stream.files(progress=progress):
+            created_files = []
+            if os.path.exists(paths[0]):
+                _, anime, ep, sent = await upload_downloaded(
+                    None, job["user_id"], bot, status_msg, created_files, [paths[0]],
+                    key=stream.gid, subs={paths[0]: paths[1:]}
+                )
+                files += sent
+                if anime: last_anime, last_ep = anime, ep
+            # Muxed copies go now; the source file goes when the window moves on
+            for f in created_files:
+                if f not in paths: await async_delete(f)
+            await job_queue.mark_done(job, index)
+    finally:
+        # Normal end already removed it; this covers errors and early exits
+        try: await downloader.remove_download(stream.gid)
+        except: pass
+        if root: await async_delete(root)
+
+    if stream.failed:
+        await status_msg.edit_text(
+            "❌ **Cancelled.**" if stream.failed == "removed" else f"❌ Download Failed after {len(files)} file(s).",
+            parse_mode="Markdown"
+        )
+        return "cancelled" if stream.failed == "removed" else "failed"
+
+    if not files:
+        await status_msg.edit_text("⚠️ No video files found.")
+        return "failed"
+    if whole:
+        await upload_index.record(link_keys(job["link"]) + link_keys(None, status.get("info_hash")), files)
+    await job_queue.finish(job, "done")
+    await finish_job(status_msg, last_anime, last_ep)
+    return "done"
+
+async def process_hls_download(url, title, quality, job, bot, status_msg, referer=None):
+    """HLS streams: segment download + stream-copy remux, then the normal upload path."""
+    created_files = []
+    safe_name = "".join(c if c.isalnum() or c in " ._-" else "_" for c in title).strip() or "episode"
+    out_path = f"./downloads/{safe_name}.mp4"
+    created_files += [out_path, out_path + ".parts"]
+    hold = None
+
+    try:
+        async def progress(done, total):
+            try:
+                # Update progress sparingly to avoid ratelimit
+                if done == total or done % max(1, total // 20) == 0:
+                    await status_msg.edit_text(f"📥 **HLS** `{done}/{total}` segments")
+            except: pass
+
+        # Size unknown up front: reserve the default estimate (segments + joined file)
+        hold = await reserve_disk(None, safe_name, status_msg)
+        await status_msg.edit_text(f"📥 Fetching HLS stream ({quality})...")
+        if not await downloader.download_hls(url, out_path, quality=quality, progress=progress, referer=referer):
+            return await status_msg.edit_text("❌ Download Failed.")
+
+        await status_msg.edit_text("✅ Processing Files...")
+        found, last_anime, last_ep, files = await upload_downloaded(out_path, job["user_id"], bot, status_msg, created_files, by_release=False)
+        if not found:
+            return await status_msg.edit_text("⚠️ No video files found.")
+        await upload_index.record(link_keys(url), files)
+        await job_queue.finish(job)
+        await finish_job(status_msg, last_anime, last_ep)
+
+    except Exception as e:
+        await send_error_log(bot, job["chat_id"], str(e))
+
+    finally:
+        await job_queue.finish(job, "failed")
+        if hold: await hold.release()
+        for f in created_files: await async_delete(f)
+
+async def run_download_job(job, bot, status_msg):
+    """Single-link job; after a restart it re-attaches to its aria2 GID if that is still alive."""
+    link = job["link"]
+    if not job.get("ep_range") and await deliver_cached(link_keys(link), job["user_id"], bot, status_msg):
+        return await job_queue.finish(job)
+
+    gid = job["gids"].get("0")
+    if gid and await downloader.is_alive(gid):
+        return await monitor_and_process_download(gid, job, bot, status_msg)
+
+    if await downloader.is_hls(link):
+        return await process_hls_download(link, "stream", "best", job, bot, status_msg)
+
+    # Direct files: size from a HEAD probe, reserved before anything is fetched.
+    # Torrents reserve once their metadata (file sizes) is in.
+    hold = None
+    if classify_link(link) == "http":
+        try:
+            hold = await reserve_disk(await downloader.expected_size(link), link, status_msg)
+        except DiskFullError as e:
+            await job_queue.finish(job, "failed")
+            return await status_msg.edit_text(f"❌ Too big for this server: {e}")
+
+    gid = await downloader.add_torrent(link, metadata_first=True)
+    if gid:
+        await job_queue.set_gid(job, 0, gid)
+        await monitor_and_process_download(gid, job, bot, status_msg, hold)
+    else:
+        if hold: await hold.release()
+        await job_queue.finish(job, "failed")
+        await status_msg.edit_text("❌ Failed.")
+
 # --- TORRENT COMMAND ---
 async def torrent_command(update, context):
-    if not context.args: return await update.message.reply_text("❌ `/torrent <link>`")
+    if not context.args: return await update.message.reply_text("❌ `/torrent <link> [episodes, e.g. 1-12]`")
     msg = await update.message.reply_text("⚡ Initializing...")
-    gid = await downloader.add_torrent(context.args[0])
-    if gid: await monitor_and_process_download(gid, update, context, msg)
-    else: await msg.edit_text("❌ Failed.")
+    job = await job_queue.submit(
+        "download", update.effective_user.id, update.effective_chat.id, msg.message_id,
+        link=context.args[0], ep_range=" ".join(context.args[1:]) or None
+    )
+    if job_queue.delegated(job):
+        return await msg.edit_text("📨 Queued. A worker will pick it up shortly.")
+    await run_download_job(job, context.bot, msg)
 
 # --- SEARCH COMMAND ---
+async def run_search_sources(q):
+    # All sources race under one deadline (AllAnime is the slow one)
+    orchestrator = SearchOrchestrator(
+        [
+            ("Common", CommonAnimeScraper().run(q)),
+            ("Gogo", scrape_gogoanime(q)),
+            ("Animix", scrape_animixplay(q)),
+            ("AllAnime", IntelligentScraper().search(q, top_n=10)),
+        ],
+        mode=Config.SEARCH_MODE,
+        deadline=Config.SEARCH_DEADLINE,
+        merge_window=Config.SEARCH_MERGE_WINDOW
+    )
+    return await orchestrator.run()
+
 async def search(update, context):
     if not context.args: return await update.message.reply_text("❌ `/search <anime>`")
     q = " ".join(context.args)
     msg = await update.message.reply_text("🔍 Searching...")
-    res = []
 
-    # 1. Try Normal Scrapers (Fast)
-    scrapers = [
-        ("Common", CommonAnimeScraper().run(q)),
-        ("Gogo", scrape_gogoanime(q)),
-        ("Animix", scrape_animixplay(q))
-    ]
-
-    for name, task in scrapers:
-        if res: break
-        try:
-            res = await asyncio.wait_for(task, timeout=25)
-            if res:
-                logger.info(f"Scraper '{name}' succeeded.")
-        except Exception:
-            pass
-
-    # 2. Fallback to AllAnime (Intelligent/Slow)
-    if not res:
-        try:
-            intelligent = IntelligentScraper()
-            res = await intelligent.search(q, top_n=10)
-        except Exception as e:
-            logger.error(f"AllAnime Search Failed: {e}")
+    try:
+        res = await search_cache.get_or_fetch(q, lambda: run_search_sources(q))
+    except Exception as e:
+        logger.error(f"Search Failed: {e}")
+        res = []
 
     if not res:
         return await msg.edit_text("❌ None found.")
@@ -279,6 +594,303 @@ async def search(update, context):
         kb.append([InlineKeyboardButton(f"🎬 {t}", callback_data=f"vid_{r.get('url')}")])
     await msg.edit_text(f"✅ Results: **{q}**", reply_markup=InlineKeyboardMarkup(kb), parse_mode="Markdown")
 
+# --- BATCH PIPELINE ---
+class BatchBoard:
+    """One status message for a whole batch, edited at most every few seconds."""
+
+    def __init__(self, status_msg, total, quality):
+        self.status_msg = status_msg
+        self.total = total
+        self.quality = quality
+        self.lines = {}      # episode index -> current stage text
+        self.gids = {}       # episode index -> active aria2 GID (for cancel buttons)
+        self.done = 0
+        self.skipped = 0
+        self._last_edit = 0
+
+    async def set(self, idx, text, gid=None, force=False):
+        self.lines[idx] = text
+        if gid: self.gids[idx] = gid
+        else: self.gids.pop(idx, None)
+        await self.flush(force)
+
+    async def finish(self, idx, ok):
+        self.lines.pop(idx, None)
+        self.gids.pop(idx, None)
+        if ok: self.done += 1
+        else: self.skipped += 1
+        await self.flush()
+
+    async def flush(self, force=False):
+        # Stay well under Telegram's edit rate limit
+        if not force and time.time() - self._last_edit < 3:
+            return
+        self._last_edit = time.time()
+
+        text = f"⚡ **Batch** ({self.quality}) ✅ `{self.done}` ❌ `{self.skipped}` / `{self.total}`"
+        for idx in sorted(self.lines)[:8]:
+            text += f"\n`{idx + 1}` {self.lines[idx]}"
+        kb = [[InlineKeyboardButton(f"❌ Cancel Ep {idx + 1}", callback_data=f"cancel_{gid}")]
+              for idx, gid in sorted(self.gids.items())[:4]]
+        try:
+            await self.status_msg.edit_text(
+                text, reply_markup=InlineKeyboardMarkup(kb) if kb else None, parse_mode="Markdown"
+            )
+        except: pass
+
+async def run_batch(job, bot, status_msg):
+    """
+    resolve -> download -> post-process -> upload, each stage with its own
+    worker count; uploads land in CHANNEL_ID in episode order.
+    Finished episodes and aria2 GIDs are checkpointed on the job, so an
+    adopted job skips what is done and re-attaches to live downloads.
+    """
+    episodes, selected_quality = job["episodes"], job["quality"]
+    items = [{"idx": i, "ep": ep, "created": []} for i, ep in enumerate(episodes) if i not in job["done"]]
+    board = BatchBoard(status_msg, len(items), selected_quality)
+    thumb_data = await db.get_thumbnail(job["user_id"])
+    variant = "sub" if "sub" in selected_quality else "dub" if "dub" in selected_quality else None
+    restart_due = False
+
+    async def resolve(item):
+        idx, ep = item["idx"], item["ep"]
+        # Uploaded before (any user, any batch): re-post instead of downloading
+        item["key"] = episode_key(ep["url"], variant)
+        item["cached"] = await upload_index.lookup([item["key"]])
+        if item["cached"]:
+            return item
+
+        # Re-adopted job: the download is still running (or finished) in aria2
+        gid = job["gids"].get(str(idx))
+        if gid and await downloader.is_alive(gid):
+            item["gid"], item["hls"] = gid, False
+            return item
+
+        # Modify URL for sub/dub if possible
+        ep_url = ep["url"] + (f"?{variant}=1" if variant else "")
+
+        # 1. Standard download if the URL itself is downloadable
+        await board.set(idx, f"🔎 `{ep['title']}`")
+        if await downloader.can_download(ep_url):
+            item["link"] = ep_url
+        else:
+            # 2. Fallback: Automated Intelligent Scraper (cached per episode + variant)
+            item["link"] = await link_cache.resolve(
+                ep["url"], variant, lambda: IntelligentScraper().resolve_download(ep_url)
+            )
+            item["cached_link"] = True
+
+        if not item["link"]:
+            return await _drop(item)
+        item["hls"] = await downloader.is_hls(item["link"])
+        return item
+
+    async def download(item):
+        idx, ep = item["idx"], item["ep"]
+        if item["cached"]:
+            return item
+
+        # Admission control: a download worker waits here until the disk has room
+        if not item.get("gid"):
+            async def waiting(need, free):
+                await board.set(idx, f"⏳ Waiting for disk (`{human_readable_size(need)}`)")
+            try:
+                size = None if item["hls"] else await downloader.expected_size(item["link"])
+                item["hold"] = await disk_admission.acquire(size, ep["title"], on_wait=waiting)
+            except DiskFullError as e:
+                logger.warning(f"Skipping {ep['title']}: {e}")
+                return await _drop(item)
+
+        if item["hls"]:
+            safe_name = "".join(c if c.isalnum() or c in " ._-" else "_" for c in ep["title"]).strip() or "episode"
+            out_path = f"./downloads/{safe_name}.mp4"
+            item["created"] += [out_path, out_path + ".parts"]
+
+            async def progress(done, total):
+                await board.set(idx, f"📥 HLS `{done}/{total}`")
+
+            # The CDN wants the page the stream was resolved from as Referer
+            if not await downloader.download_hls(
+                item["link"], out_path, quality=selected_quality, progress=progress, referer=ep["url"]
+            ):
+                return await _drop(item)
+            item["base_path"] = out_path
+            return item
+
+        gid = item.get("gid") or await downloader.add_torrent(item["link"])
+        if not gid:
+            if item.get("cached_link"):
+                await link_cache.invalidate(ep["url"], variant)
+            return await _drop(item)
+        await job_queue.set_gid(job, idx, gid)
+
+        async def progress(status):
+            if item.get("hold") and status["total_length"]:
+                await item["hold"].resize(2 * status["total_length"] - status["completed_length"])
+            await board.set(idx, f"📥 `{status['progress']}%` {status['speed']}", gid=gid)
+
+        gid = await downloader.wait_for_completion(gid, callback=progress)
+        item["gid"] = gid
+        await job_queue.set_gid(job, idx, gid)
+        status = await downloader.get_status(gid)
+        if not status or status["status"] != "complete":
+            return await _drop(item)
+
+        item["base_path"] = f"./downloads/{status['name']}"
+        item["created"].append(item["base_path"])
+        # Only the mux copy is still to be written
+        if item.get("hold"): await item["hold"].resize(status["total_length"])
+        return item
+
+    async def post_process(item):
+        if item["cached"]:
+            return item
+        await board.set(item["idx"], "⚙️ Processing")
+        # {video: [subtitles]} from aria2; a directory walk guesses subtitles by name
+        subs = await downloader.downloaded_files(item["gid"]) if item.get("gid") else None
+        videos = list(subs) if subs is not None else await asyncio.to_thread(collect_videos, item["base_path"])
+        if not videos:
+            return await _drop(item)
+
+        # Same release already in the channel (e.g. via /torrent): skip the mux
+        async def on_mux(pct):
+            await board.set(item["idx"], f"🎬 Muxing `{pct}%`", gid=item.get("gid"))
+
+        item["files"], item["reuse"] = [], []
+        for v in videos:
+            # HLS output is named after the episode title, not the release
+            rkey = None if item["hls"] else release_key(v)
+            entry = await upload_index.lookup([rkey])
+            if entry:
+                item["reuse"].append((rkey, entry))
+                continue
+            try:
+                item["files"].append(await prepare_video(
+                    v, item["created"], key=item.get("gid"), progress=on_mux, subs=(subs or {}).get(v)
+                ))
+            except MuxCancelled:
+                return await _drop(item)
+        # Everything is on disk now; free space itself tracks it from here
+        if item.get("hold"): await item["hold"].release()
+        return item
+
+    async def upload(item):
+        nonlocal restart_due
+        idx = item["idx"]
+        files = []
+        try:
+            if item["cached"]:
+                await board.set(idx, "⚡ Re-posting cached upload")
+                files += await upload_index.deliver(bot, item["cached"], [item["key"]])
+            for rkey, entry in item.get("reuse", []):
+                files += await upload_index.deliver(bot, entry, [rkey])
+
+            for final_path, fname in item.get("files", []):
+                async def on_attempt(attempt):
+                    await board.set(idx, f"⬆️ Uploading | Attempt {attempt+1}/3")
+
+                sent_msg = await upload_video(bot, final_path, fname, thumb_data, on_attempt)
+                if sent_msg:
+                    files.append(sent_file(sent_msg, fname, os.path.getsize(final_path)))
+                    if not item["hls"]: await upload_index.record([release_key(fname)], files[-1:])
+                    await db.update_stats(job["user_id"], os.path.getsize(final_path))
+
+            for f in files:
+                await db.add_history(job["user_id"], f["fname"])
+            if files and not item["cached"]:
+                await upload_index.record([item["key"]], files)
+        finally:
+            await _cleanup(item)
+        sent_any = bool(files)
+        await job_queue.mark_done(job, idx)
+        await board.finish(idx, sent_any)
+        if sent_any and not item["cached"] and await count_job():
+            # Finish the batch first; restarting now would lose in-flight episodes
+            restart_due = True
+        return sent_any
+
+    async def _drop(item):
+        await _cleanup(item)
+        # Failed episodes count as handled; a restart shouldn't retry them forever
+        await job_queue.mark_done(job, item["idx"])
+        await board.finish(item["idx"], False)
+        return None
+
+    async def _cleanup(item):
+        # Non-blocking cleanup
+        for f in item["created"]: await async_delete(f)
+        if item.get("gid"): await downloader.forget(item["gid"])
+        if item.get("hold"): await item["hold"].release()
+
+    pipeline = StagedPipeline([
+        ("resolve", resolve, Config.PIPELINE_RESOLVERS),
+        ("download", download, Config.PIPELINE_DOWNLOADS),
+        ("process", post_process, Config.PIPELINE_PROCESSORS),
+        ("upload", upload, 1),
+    ])
+    try:
+        await pipeline.run(items)
+    except Exception as e:
+        await send_error_log(bot, job["chat_id"], str(e))
+    finally:
+        # Stages that raised never reached their own cleanup
+        for item in items: await _cleanup(item)
+        await job_queue.finish(job)
+
+    await board.flush(force=True)
+    await status_msg.reply_text(
+        f"✅ **All Episodes Processed.** ({board.done}/{len(items)} uploaded)", parse_mode="Markdown"
+    )
+    if restart_due:
+        await maintenance_restart(status_msg)
+
+# --- JOB RUNNERS ---
+class StatusMessage:
+    """The user's status message, addressed by id (workers never saw the original Update)."""
+
+    def __init__(self, bot, chat_id, message_id):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    async def edit_text(self, text, **kwargs):
+        return await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id, **kwargs)
+
+    async def reply_text(self, text, **kwargs):
+        return await self.bot.send_message(self.chat_id, text, reply_to_message_id=self.message_id, **kwargs)
+
+async def run_job(job, bot):
+    """Worker mode entry point for a claimed job."""
+    if job.get("message_id"):
+        status_msg = StatusMessage(bot, job["chat_id"], job["message_id"])
+    else:
+        status_msg = await bot.send_message(job["chat_id"], "⚙️ Starting...")
+    try:
+        await status_msg.edit_text(f"⚙️ Picked up by worker `{job_queue.worker_id}`...", parse_mode="Markdown")
+    except: pass
+
+    runner = run_batch if job["kind"] == "batch" else run_download_job
+    await runner(job, bot, status_msg)
+
+RESUMED_TASKS = set()
+
+async def resume_jobs(bot):
+    """Boot hook: adopt jobs a previous process (or a dead peer) left unfinished."""
+    for job in await job_queue.adopt():
+        try:
+            status_msg = await bot.send_message(
+                job["chat_id"], f"♻️ Resuming unfinished {job['kind']} after restart..."
+            )
+        except Exception as e:
+            logger.warning(f"Cannot reach chat {job['chat_id']}: {e}")
+            await job_queue.finish(job, "failed")
+            continue
+
+        runner = run_batch if job["kind"] == "batch" else run_download_job
+        task = asyncio.create_task(runner(job, bot, status_msg))
+        RESUMED_TASKS.add(task)
+        task.add_done_callback(RESUMED_TASKS.discard)
+
 # --- BUTTON CALLBACKS ---
 QUALITY_OPTIONS = ["1080p sub", "1080p dub", "720p sub", "720p dub"]
 
@@ -290,22 +902,7 @@ async def button_callback(update, context):
     # --- STEP 1: Fetch Episodes for Selected Anime ---
     if d.startswith("vid_"):
         anime_url = d.split("_", 1)[1]
-        episodes = []
-        
-        # Try finding episodes
-        try:
-            if "gogoanime3" in anime_url:
-                from scrapers.gogoanime3 import get_gogoanime_episodes
-                episodes = await get_gogoanime_episodes(anime_url)
-            elif "animixplay" in anime_url:
-                from scrapers.animixplay import get_animixplay_episodes
-                episodes = await get_animixplay_episodes(anime_url)
-            else:
-                # Default/Common
-                scraper = CommonAnimeScraper()
-                episodes = await scraper.get_episodes(anime_url)
-        except Exception as e:
-            logger.error(f"Episode fetch error: {e}")
+        episodes = await episode_index.get(anime_url)
 
         if not episodes:
              await q.edit_message_text("❌ Could not fetch episode list. Try another source.")
@@ -332,63 +929,29 @@ async def button_callback(update, context):
             return
 
         status_msg = q.message
-        total_eps = len(episodes)
-        
-        await status_msg.edit_text(f"⚡ Queueing **{total_eps}** episodes ({selected_quality})...")
-        
-        # Loop through episodes sequentially
-        for index, ep in enumerate(episodes, 1):
-            ep_url = ep["url"]
-            ep_title = ep["title"]
-            
-            # Modify URL for sub/dub if possible
-            if "sub" in selected_quality: ep_url += "?sub=1"
-            elif "dub" in selected_quality: ep_url += "?dub=1"
+        await status_msg.edit_text(f"⚡ Queueing **{len(episodes)}** episodes ({selected_quality})...")
 
-            try:
-                await status_msg.edit_text(
-                    f"⏳ **Processing {index}/{total_eps}**\n"
-                    f"📺 `{ep_title}`\n"
-                    f"⚙️ Attempting Standard Download..."
-                )
-                
-                # 1. Try Standard Download
-                gid = await downloader.add_torrent(ep_url)
-                
-                # 2. Fallback: Automated Intelligent Scraper
-                if not gid:
-                    await status_msg.edit_text(f"⚙️ Standard failed. Creating automation task...")
-                    try:
-                        scraper = IntelligentScraper()
-                        # resolve_download returns a direct link
-                        direct_link = await scraper.resolve_download(ep_url)
-                        if direct_link:
-                            gid = await downloader.add_torrent(direct_link)
-                    except Exception as e:
-                        logger.error(f"Automation failed for {ep_title}: {e}")
-
-                # 3. Monitor & Upload (Blocking Wait)
-                if gid:
-                    # Pass status_msg so it updates progress inside this function
-                    await monitor_and_process_download(gid, update, context, status_msg)
-                else:
-                    await status_msg.edit_text(f"❌ Skipped: {ep_title} (No link found)")
-                    await asyncio.sleep(2)
-
-            except Exception as e:
-                logger.error(f"Batch Loop Error on {ep_title}: {e}")
-                await asyncio.sleep(1)
-
-        await status_msg.edit_text("✅ **All Episodes Processed.**")
-        
-        # Cleanup Context
+        job = await job_queue.submit(
+            "batch", update.effective_user.id, update.effective_chat.id, status_msg.message_id,
+            episodes=episodes, quality=selected_quality
+        )
         context.user_data["pending_episodes"] = []
+        if job_queue.delegated(job):
+            return await status_msg.edit_text(f"📨 Queued **{len(episodes)}** episodes. A worker will pick them up shortly.", parse_mode="Markdown")
+        await run_batch(job, context.bot, status_msg)
 
     # --- CANCEL TASK ---
     elif d.startswith("cancel_"):
         gid = d.split("_", 1)[1]
+        if Config.BOT_MODE == "frontend":
+            # The download lives on a worker's aria2; it polls for cancel flags
+            if await db.request_cancel(gid):
+                await q.edit_message_text("🛑 **Cancel sent to worker.**", parse_mode="Markdown")
+            else:
+                await q.edit_message_text("❌ Job already finished.")
+            return
         try:
-            await downloader.remove_download(gid)
+            await cancel_download(gid)
             await async_delete(f"./downloads/{gid}")
             await q.edit_message_text("🛑 **Stopped and cleaned.**", parse_mode="Markdown")
         except Exception as e:
@@ -0,0 +1,173 @@
+import os
+import time
+import shutil
+import asyncio
+import logging
+from database.mongo import db
+from config import Config
+from utils.memory_manager import newest_mtime
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3             # a job that crashed its worker this often is parked as failed
+POLL_SECONDS = 5             # worker mode: how often an idle worker looks for queued jobs
+DOWNLOAD_DIR = "./downloads"
+ARIA2_SESSION = "aria2.session"
+STALE_DOWNLOAD_SECONDS = 12 * 3600
+
+
+class JobQueue:
+    """
+    Durable jobs on top of Mongo: every batch / download is a document
+    leased to this worker and kept alive by a heartbeat. Progress (finished
+    episodes, aria2 GIDs) is checkpointed on the document, so after a
+    WORKER_TTL restart the next boot adopts the job and resumes from there.
+    Without Mongo everything still runs, just without the safety net.
+
+    BOT_MODE=frontend only enqueues; BOT_MODE=worker processes claim
+    queued jobs through serve() and report straight to the user's status
+    message via the Bot API.
+    """
+
+    def __init__(self, worker_id=Config.WORKER_ID, lease=Config.JOB_LEASE, mode=Config.BOT_MODE):
+        self.worker_id = worker_id
+        self.lease = lease
+        self.mode = mode
+        self.active = {}      # job_id -> job dict
+        self.on_cancel = None # async fn(gid), set by serve()
+        self._task = None
+
+    async def submit(self, kind, user_id, chat_id, message_id=None, **payload):
+        job = {
+            "kind": kind, "user_id": user_id, "chat_id": chat_id, "message_id": message_id,
+            "done": [], "gids": {}, **payload
+        }
+        owner = None if self.mode == "frontend" else self.worker_id
+        job["_id"] = await db.create_job(dict(job), owner, self.lease)
+        if owner:
+            self._track(job)
+        return job
+
+    def delegated(self, job):
+        """True when a worker will run this job (front-end mode with a working queue)."""
+        return self.mode == "frontend" and job["_id"] is not None
+
+    async def adopt(self):
+        """Claim every unfinished job that nobody is heartbeating any more."""
+        parked = await db.fail_exhausted_jobs(MAX_ATTEMPTS)
+        if parked:
+            logger.warning(f"🪦 Parked {parked} job(s) that failed {MAX_ATTEMPTS} times.")
+
+        adopted = []
+        while True:
+            job = await db.claim_job(self.worker_id, self.lease, MAX_ATTEMPTS, exclude=self.active, own=True)
+            if not job:
+                break
+            job.setdefault("done", [])
+            job.setdefault("gids", {})
+            self._track(job)
+            adopted.append(job)
+        if adopted:
+            logger.info(f"♻️ Adopted {len(adopted)} unfinished job(s).")
+        return adopted
+
+    # -------------------------
+    # Checkpoints
+    # -------------------------
+
+    async def set_gid(self, job, idx, gid):
+        job["gids"][str(idx)] = gid
+        await db.update_job(job["_id"], {f"gids.{idx}": gid}, add_to_set={"gid_list": gid})
+
+    async def mark_done(self, job, idx):
+        if idx not in job["done"]:
+            job["done"].append(idx)
+        await db.update_job(job["_id"], add_to_set={"done": idx})
+
+    async def finish(self, job, state="done"):
+        # First call wins; the "failed" fallbacks in finally blocks are then no-ops
+        if self.active.pop(job["_id"], None) is None:
+            return
+        await db.finish_job(job["_id"], state)
+
+    async def release(self):
+        """Called right before a maintenance restart."""
+        await db.release_jobs(self.worker_id)
+
+    # -------------------------
+    # Worker mode
+    # -------------------------
+
+    async def serve(self, runner, capacity, on_cancel=None):
+        """Claim queued / orphaned jobs forever, at most `capacity` at a time."""
+        self.on_cancel = on_cancel
+        running = set()
+        while True:
+            if len(running) < capacity:
+                await db.fail_exhausted_jobs(MAX_ATTEMPTS)
+                job = await db.claim_job(self.worker_id, self.lease, MAX_ATTEMPTS, exclude=self.active)
+                if job:
+                    job.setdefault("done", [])
+                    job.setdefault("gids", {})
+                    self._track(job)
+                    logger.info(f"📦 {self.worker_id} claimed {job['kind']} job {job['_id']}")
+                    task = asyncio.create_task(self._run(runner, job))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+                    continue
+            await asyncio.sleep(POLL_SECONDS)
+
+    async def _run(self, runner, job):
+        try:
+            await runner(job)
+        except Exception as e:
+            logger.error(f"Job {job['_id']} crashed: {e}")
+        finally:
+            # Runners finish their own jobs; anything left over failed
+            await self.finish(job, "failed")
+
+    # -------------------------
+    # Heartbeat
+    # -------------------------
+
+    def _track(self, job):
+        if job["_id"] is None:
+            return
+        self.active[job["_id"]] = job
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._heartbeat())
+
+    async def _heartbeat(self):
+        while self.active:
+            await asyncio.sleep(self.lease / 3)
+            await db.heartbeat_jobs(list(self.active), self.worker_id, self.lease)
+            if self.on_cancel:
+                for gid in await db.pop_cancels(list(self.active)):
+                    try:
+                        await self.on_cancel(gid)
+                    except Exception as e:
+                        logger.warning(f"Cancel of {gid} failed: {e}")
+
+
+def sweep_stale_downloads(max_age=STALE_DOWNLOAD_SECONDS, keep=()):
+    """
+    Boot-time replacement for the old `rm -rf downloads/*`: partial files of
+    adoptable jobs stay (aria2 resumes them), leftovers nobody touched for
+    half a day go. `keep`: top-level names aria2 still has downloads in.
+    """
+    if not os.path.isdir(DOWNLOAD_DIR):
+        return
+    cutoff = time.time() - max_age
+    for entry in os.scandir(DOWNLOAD_DIR):
+        if entry.name == ARIA2_SESSION or entry.name in keep:
+            continue
+        try:
+            # A pack folder's own mtime doesn't move while files inside are written
+            if newest_mtime(entry.path) < cutoff:
+                if entry.is_dir(): shutil.rmtree(entry.path)
+                else: os.remove(entry.path)
+        except Exception as e:
+            logger.warning(f"Failed to sweep {entry.path}: {e}")
+
+
+job_queue = JobQueue()
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class StagedPipeline:
+    """
+    resolve -> download -> post-process -> upload, joined by bounded queues.
+    - every stage has its own worker count, so episode N+1 downloads while N uploads
+    - bounded queues give back-pressure (resolvers can't race far ahead)
+    - the last stage runs strictly in input order (channel posts stay in episode order)
+    A stage returning None (or raising) drops that item; later items keep flowing.
+    """
+
+    def __init__(self, stages, queue_size=2):
+        # stages: [(name, async fn(item) -> item|None, workers), ...]
+        self.stages = stages
+        self.queue_size = queue_size
+
+    async def run(self, items):
+        items = list(items)
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results = [None] * len(items)
+
+        async def feed():
+            for idx, item in enumerate(items):
+                await queues[0].put((idx, item))
+
+        async def worker(stage_no):
+            name, fn, _ = self.stages[stage_no]
+            while True:
+                job = await queues[stage_no].get()
+                if job is _DONE:
+                    return
+                idx, item = job
+                if item is not None:
+                    try:
+                        item = await fn(item)
+                    except Exception as e:
+                        logger.error(f"Pipeline stage '{name}' failed on item {idx}: {e}")
+                        item = None
+                await queues[stage_no + 1].put((idx, item))
+
+        async def ordered_tail():
+            name, fn, _ = self.stages[-1]
+            pending, next_idx = {}, 0
+            while next_idx < len(items):
+                idx, item = await queues[-1].get()
+                pending[idx] = item
+                while next_idx in pending:
+                    item = pending.pop(next_idx)
+                    if item is not None:
+                        try:
+                            results[next_idx] = await fn(item)
+                        except Exception as e:
+                            logger.error(f"Pipeline stage '{name}' failed on item {next_idx}: {e}")
+                    next_idx += 1
+
+        async def stage_group(stage_no):
+            workers = self.stages[stage_no][2]
+            await asyncio.gather(*(worker(stage_no) for _ in range(max(1, workers))))
+
+        async def middle():
+            # Close each stage once the one before it has drained
+            for stage_no in range(len(self.stages) - 1):
+                group = asyncio.create_task(stage_group(stage_no))
+                groups.append(group)
+            await feed()
+            for stage_no, group in enumerate(groups):
+                for _ in range(max(1, self.stages[stage_no][2])):
+                    await queues[stage_no].put(_DONE)
+                await group
+
+        groups = []
+        tail = asyncio.create_task(ordered_tail())
+        try:
+            await middle()
+            await tail
+        finally:
+            for task in groups + [tail]:
+                task.cancel()
+            await asyncio.gather(*groups, tail, return_exceptions=True)
+        return results
@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 # Load .env file if it exists (useful for local testing)
@@ -42,3 +43,32 @@ class Config:
     # Worker Recycling: Restarts the bot after N downloads to clear memory leaks.
     # Set to 0 to disable. Recommended: 10-20 for 512MB RAM.
     WORKER_TTL = int(os.getenv("WORKER_TTL", "20"))
+
+    # Job queue: a worker re-adopts its own unfinished jobs right after a
+    # restart; a peer's jobs only once their lease runs out.
+    # hostname-pid: stable inside Docker (bot is PID 1), unique for local processes.
+    WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+    JOB_LEASE = int(os.getenv("JOB_LEASE", "90"))
+
+    # Deployment: "all" (one process does everything), "frontend" (Telegram
+    # polling + search, enqueues jobs) or "worker" (claims and runs jobs).
+    BOT_MODE = os.getenv("BOT_MODE", "all").lower()
+    WORKER_JOBS = int(os.getenv("WORKER_JOBS", "2"))
+
+    # Search fan-out: "first" (fastest non-empty source wins) or "merge"
+    SEARCH_MODE = os.getenv("SEARCH_MODE", "first").lower()
+    SEARCH_DEADLINE = int(os.getenv("SEARCH_DEADLINE", "30"))
+    SEARCH_MERGE_WINDOW = int(os.getenv("SEARCH_MERGE_WINDOW", "12"))
+
+    # Batch pipeline: workers per stage (upload is always 1, in episode order)
+    PIPELINE_RESOLVERS = int(os.getenv("PIPELINE_RESOLVERS", "2"))
+    PIPELINE_DOWNLOADS = int(os.getenv("PIPELINE_DOWNLOADS", "2"))
+    PIPELINE_PROCESSORS = int(os.getenv("PIPELINE_PROCESSORS", "1"))
+
+    # Disk admission: free space kept untouched on top of every reservation
+    DISK_HEADROOM_MB = int(os.getenv("DISK_HEADROOM_MB", "512"))
+
+    # aria2 tuner: uplink capacity in Mbit/s (0 = learn it from observed peaks)
+    # and where to refresh the BitTorrent tracker list from ("" = keep static list)
+    UPLINK_MBPS = float(os.getenv("UPLINK_MBPS", "0"))
+    TRACKERS_URL = os.getenv("TRACKERS_URL", "https://raw.githubusercontent.com/ngosang/trackerslist/master/trackers_best.txt")
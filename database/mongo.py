@@ -2,18 +2,27 @@ import motor.motor_asyncio
 import re
 import logging
 import asyncio
-from datetime import datetime
-from functools import lru_cache
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
 from config import Config
+from utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
 class MongoDB:
     def __init__(self):
+        # Stores results, not coroutines (lru_cache on an async def cached the coroutine)
+        self.thumbnails = TTLCache(maxsize=128, max_age=600)
         self.client = None
         self.db = None
         self.users = None
         self.history = None
+        self.search_cache = None
+        self.episodes = None
+        self.links = None
+        self.browser_state = None
+        self.jobs = None
+        self.uploads = None
 
         if not Config.MONGO_URL:
             logger.warning("MONGO_URL not found! DB features disabled.")
@@ -29,6 +38,12 @@ class MongoDB:
             self.db = self.client[Config.DB_NAME]
             self.users = self.db.users
             self.history = self.db.history
+            self.search_cache = self.db.search_cache
+            self.episodes = self.db.episodes
+            self.links = self.db.resolved_links
+            self.browser_state = self.db.browser_state
+            self.jobs = self.db.jobs
+            self.uploads = self.db.uploads
             logger.info("✅ MongoDB client initialized.")
         except Exception as e:
             logger.error(f"Failed to connect MongoDB: {e}")
@@ -49,6 +64,31 @@ class MongoDB:
                 [("last_updated", 1)],
                 expireAfterSeconds=30*24*3600  # 30 days
             )
+            # Search result cache: one doc per normalized query, dropped after 1 day
+            await self.search_cache.create_index("query", unique=True, background=True)
+            await self.search_cache.create_index(
+                [("updated_at", 1)],
+                expireAfterSeconds=24*3600
+            )
+            # Episode index: one doc per anime page URL
+            await self.episodes.create_index("anime_url", unique=True, background=True)
+            # Resolved direct links: each doc carries its own host-specific expiry
+            await self.links.create_index("key", unique=True, background=True)
+            await self.links.create_index([("expires_at", 1)], expireAfterSeconds=0)
+            # Browser cookies / localStorage per site: 7 days
+            await self.browser_state.create_index("site", unique=True, background=True)
+            await self.browser_state.create_index(
+                [("updated_at", 1)],
+                expireAfterSeconds=7*24*3600
+            )
+            # Job queue: lease lookups + finished jobs dropped after 7 days
+            await self.jobs.create_index([("state", 1), ("lease_until", 1)], background=True)
+            await self.jobs.create_index(
+                [("finished_at", 1)],
+                expireAfterSeconds=7*24*3600
+            )
+            # Upload index: infohash / episode URL / release name -> Telegram file_ids
+            await self.uploads.create_index("key", unique=True, background=True)
             logger.info("✅ MongoDB indexes created.")
         except Exception as e:
             logger.error(f"Failed to create indexes: {e}")
@@ -134,15 +174,287 @@ class MongoDB:
             upsert=True
         )
 
+    # --- Search Result Cache ---
+    async def get_search_cache(self, query):
+        if self.db is None: return None
+        try:
+            return await self.search_cache.find_one({"query": query})
+        except Exception as e:
+            logger.error(f"Search cache read failed: {e}")
+            return None
+
+    async def set_search_cache(self, query, results):
+        if self.db is None: return
+        try:
+            await self.search_cache.update_one(
+                {"query": query},
+                {"$set": {"results": results, "updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Search cache write failed: {e}")
+
+    # --- Episode Index ---
+    async def get_episode_index(self, anime_url):
+        if self.db is None: return None
+        try:
+            return await self.episodes.find_one({"anime_url": anime_url})
+        except Exception as e:
+            logger.error(f"Episode index read failed: {e}")
+            return None
+
+    async def set_episode_index(self, anime_url, episodes, max_ep):
+        if self.db is None: return
+        try:
+            await self.episodes.update_one(
+                {"anime_url": anime_url},
+                {"$set": {"episodes": episodes, "max_ep": max_ep, "updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Episode index write failed: {e}")
+
+    # --- Resolved Link Cache ---
+    async def get_resolved_link(self, key):
+        if self.db is None: return None
+        try:
+            # TTL sweeps run once a minute, so double-check expiry here
+            return await self.links.find_one({"key": key, "expires_at": {"$gt": datetime.utcnow()}})
+        except Exception as e:
+            logger.error(f"Link cache read failed: {e}")
+            return None
+
+    async def set_resolved_link(self, key, link, expires_at):
+        if self.db is None: return
+        try:
+            await self.links.update_one(
+                {"key": key},
+                {"$set": {"link": link, "expires_at": expires_at}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Link cache write failed: {e}")
+
+    async def delete_resolved_link(self, key):
+        if self.db is None: return
+        try:
+            await self.links.delete_one({"key": key})
+        except Exception as e:
+            logger.error(f"Link cache delete failed: {e}")
+
+    # --- Browser Session State ---
+    async def get_browser_states(self):
+        if self.db is None: return []
+        try:
+            return await self.browser_state.find({}).to_list(length=200)
+        except Exception as e:
+            logger.error(f"Browser state read failed: {e}")
+            return []
+
+    async def set_browser_state(self, site, cookies, origins, user_agent=None):
+        if self.db is None: return
+        try:
+            await self.browser_state.update_one(
+                {"site": site},
+                {"$set": {"cookies": cookies, "origins": origins, "user_agent": user_agent, "updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Browser state write failed: {e}")
+
+    async def delete_browser_state(self, site):
+        if self.db is None: return
+        try:
+            await self.browser_state.delete_one({"site": site})
+        except Exception as e:
+            logger.error(f"Browser state delete failed: {e}")
+
+    # --- Job Queue (leases + heartbeats) ---
+    async def create_job(self, job, owner, lease_seconds):
+        """
+        Insert a job already leased to `owner`, or (owner=None) a queued
+        job for any worker to claim. Returns its id (None without DB).
+        """
+        if self.db is None: return None
+        now = datetime.utcnow()
+        try:
+            res = await self.jobs.insert_one({
+                **job,
+                "state": "running" if owner else "queued",
+                "owner": owner,
+                "attempts": 1 if owner else 0,
+                "lease_until": now + timedelta(seconds=lease_seconds) if owner else now,
+                "created_at": now,
+                "updated_at": now
+            })
+            return res.inserted_id
+        except Exception as e:
+            logger.error(f"Job create failed: {e}")
+            return None
+
+    async def claim_job(self, owner, lease_seconds, max_attempts, exclude=(), own=False):
+        """
+        Atomically take over one queued job, or an unfinished one whose
+        lease ran out. `own=True` (boot-time adoption only) also takes jobs
+        this worker owned before it restarted; `exclude` are the job ids
+        already running here.
+        """
+        if self.db is None: return None
+        now = datetime.utcnow()
+        takeable = [{"state": "queued"}, {"lease_until": {"$lt": now}}]
+        if own:
+            takeable.append({"owner": owner})
+        try:
+            return await self.jobs.find_one_and_update(
+                {
+                    "_id": {"$nin": list(exclude)},
+                    "state": {"$in": ["queued", "running"]},
+                    "attempts": {"$lt": max_attempts},
+                    "$or": takeable
+                },
+                {
+                    "$set": {
+                        "state": "running", "owner": owner,
+                        "lease_until": now + timedelta(seconds=lease_seconds), "updated_at": now
+                    },
+                    "$inc": {"attempts": 1}
+                },
+                sort=[("created_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            logger.error(f"Job claim failed: {e}")
+            return None
+
+    async def fail_exhausted_jobs(self, max_attempts):
+        """Jobs that keep killing their worker are parked instead of retried forever."""
+        if self.db is None: return 0
+        now = datetime.utcnow()
+        try:
+            res = await self.jobs.update_many(
+                {"state": "running", "attempts": {"$gte": max_attempts}, "lease_until": {"$lt": now}},
+                {"$set": {"state": "failed", "finished_at": now, "updated_at": now}}
+            )
+            return res.modified_count
+        except Exception as e:
+            logger.error(f"Job sweep failed: {e}")
+            return 0
+
+    async def heartbeat_jobs(self, job_ids, owner, lease_seconds):
+        if self.db is None or not job_ids: return
+        now = datetime.utcnow()
+        try:
+            await self.jobs.update_many(
+                {"_id": {"$in": list(job_ids)}, "owner": owner, "state": "running"},
+                {"$set": {"lease_until": now + timedelta(seconds=lease_seconds), "heartbeat_at": now}}
+            )
+        except Exception as e:
+            logger.error(f"Job heartbeat failed: {e}")
+
+    async def release_jobs(self, owner):
+        """Expire this worker's leases now so the next boot (or a peer) adopts them at once."""
+        if self.db is None: return
+        try:
+            await self.jobs.update_many(
+                {"owner": owner, "state": "running"},
+                {"$set": {"lease_until": datetime.utcnow()}}
+            )
+        except Exception as e:
+            logger.error(f"Job release failed: {e}")
+
+    async def update_job(self, job_id, set_fields=None, add_to_set=None):
+        if self.db is None or job_id is None: return
+        update = {"$set": {**(set_fields or {}), "updated_at": datetime.utcnow()}}
+        if add_to_set:
+            update["$addToSet"] = add_to_set
+        try:
+            await self.jobs.update_one({"_id": job_id}, update)
+        except Exception as e:
+            logger.error(f"Job update failed: {e}")
+
+    async def request_cancel(self, gid):
+        """Front-end side of a cancel button: flag the GID on whichever job runs it."""
+        if self.db is None: return False
+        try:
+            res = await self.jobs.update_one(
+                {"state": "running", "gid_list": gid},
+                {"$addToSet": {"cancel": gid}}
+            )
+            return res.modified_count > 0
+        except Exception as e:
+            logger.error(f"Cancel request failed: {e}")
+            return False
+
+    async def pop_cancels(self, job_ids):
+        """Worker side: collect (and clear) cancel flags on its own jobs."""
+        if self.db is None or not job_ids: return []
+        gids = []
+        try:
+            async for doc in self.jobs.find({"_id": {"$in": list(job_ids)}, "cancel.0": {"$exists": True}}, {"cancel": 1}):
+                await self.jobs.update_one({"_id": doc["_id"]}, {"$pullAll": {"cancel": doc["cancel"]}})
+                gids += doc["cancel"]
+        except Exception as e:
+            logger.error(f"Cancel poll failed: {e}")
+        return gids
+
+    async def finish_job(self, job_id, state="done"):
+        if self.db is None or job_id is None: return
+        now = datetime.utcnow()
+        try:
+            await self.jobs.update_one(
+                {"_id": job_id},
+                {"$set": {"state": state, "finished_at": now, "updated_at": now}}
+            )
+        except Exception as e:
+            logger.error(f"Job finish failed: {e}")
+
+    # --- Upload Index (file_id dedup) ---
+    async def get_upload(self, keys):
+        if self.db is None or not keys: return None
+        try:
+            return await self.uploads.find_one({"key": {"$in": list(keys)}})
+        except Exception as e:
+            logger.error(f"Upload index read failed: {e}")
+            return None
+
+    async def set_upload(self, keys, files):
+        if self.db is None or not keys: return
+        now = datetime.utcnow()
+        try:
+            for key in keys:
+                await self.uploads.update_one(
+                    {"key": key},
+                    {"$set": {"files": files, "updated_at": now}},
+                    upsert=True
+                )
+        except Exception as e:
+            logger.error(f"Upload index write failed: {e}")
+
+    async def delete_upload(self, keys):
+        if self.db is None or not keys: return
+        try:
+            await self.uploads.delete_many({"key": {"$in": list(keys)}})
+        except Exception as e:
+            logger.error(f"Upload index delete failed: {e}")
+
     # --- Thumbnails with LRU Cache ---
-    @lru_cache(maxsize=128)
     async def get_thumbnail(self, user_id):
         if self.db is None: return None
-        user = await self.users.find_one({"user_id": user_id})
-        return user.get("thumbnail") if user else None
+        thumb, age = self.thumbnails.get(user_id)
+        if age is not None:
+            return thumb
+        try:
+            user = await self.users.find_one({"user_id": user_id})
+        except Exception as e:
+            logger.error(f"Thumbnail read failed: {e}")
+            return None
+        thumb = user.get("thumbnail") if user else None
+        self.thumbnails.set(user_id, thumb)
+        return thumb
 
     async def set_thumbnail(self, user_id, photo_binary):
         if self.db is None: return
+        self.thumbnails.set(user_id, photo_binary)
         await self.users.update_one(
             {"user_id": user_id},
             {"$set": {"thumbnail": photo_binary}},
@@ -0,0 +1,87 @@
+import os
+import shutil
+import asyncio
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_DIR = "./downloads"
+RECHECK_SECONDS = 30               # free space also changes behind our back (cleanup, other jobs)
+UNKNOWN_SIZE = 1024 * 1024 * 1024  # HLS / servers without Content-Length
+
+
+class DiskFullError(Exception):
+    """The download can never fit on this disk, however long it waits."""
+
+
+class Reservation:
+    """Bytes promised to one download; shrink it as stages finish, release when done."""
+
+    def __init__(self, admission, nbytes, label):
+        self.admission = admission
+        self.nbytes = nbytes
+        self.label = label
+
+    async def resize(self, nbytes):
+        await self.admission._resize(self, max(0, nbytes))
+
+    async def release(self):
+        await self.admission._resize(self, 0)
+
+
+class DiskAdmission:
+    """
+    Downloads only start when the disk can hold them *and* the `_muxed`
+    copy ffmpeg writes next to them, minus what running downloads have
+    already been promised. Jobs that don't fit yet wait their turn.
+    """
+
+    def __init__(self, path=DOWNLOAD_DIR, headroom=Config.DISK_HEADROOM_MB * 1024 * 1024):
+        self.path = path
+        self.headroom = headroom
+        self.reserved = 0
+        self._cond = asyncio.Condition()
+
+    def usage(self):
+        os.makedirs(self.path, exist_ok=True)
+        return shutil.disk_usage(self.path)
+
+    def available(self):
+        return self.usage().free - self.headroom - self.reserved
+
+    async def acquire(self, file_size, label="", mux_copy=True, on_wait=None):
+        """
+        Reserve room for a download of `file_size` bytes (None = unknown).
+        Waits until it fits; raises DiskFullError if it never could.
+        """
+        need = (file_size or UNKNOWN_SIZE) * (2 if mux_copy else 1)
+        if need > self.usage().total - self.headroom:
+            raise DiskFullError(f"{label} needs {need // 1024**2} MB, disk is only {self.usage().total // 1024**2} MB")
+
+        if on_wait and need > self.available():
+            await on_wait(need, max(0, self.available()))
+
+        async with self._cond:
+            while need > self.available():
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=RECHECK_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            self.reserved += need
+
+        logger.info(f"💽 Reserved {need // 1024**2} MB for {label} (total reserved {self.reserved // 1024**2} MB)")
+        return Reservation(self, need, label)
+
+    async def _resize(self, reservation, nbytes):
+        async with self._cond:
+            self.reserved -= reservation.nbytes - nbytes
+            reservation.nbytes = nbytes
+            self._cond.notify_all()
+
+    def snapshot(self):
+        usage = self.usage()
+        return {"free": usage.free, "total": usage.total, "reserved": self.reserved}
+
+
+disk_admission = DiskAdmission()
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# aria2 pushes these over its RPC WebSocket
+DONE_EVENTS = {
+    "aria2.onDownloadComplete": "complete",
+    "aria2.onBtDownloadComplete": "complete",
+    "aria2.onDownloadError": "error",
+    "aria2.onDownloadStop": "removed",
+}
+RECENT_EVENTS = 512    # remember events that fire before anyone waits for them
+
+
+class Aria2Notifier:
+    """
+    One WebSocket subscription to aria2 for the whole bot.
+    wait(gid) wakes up the moment aria2 reports that download as finished.
+    Events are one-shot: consuming one clears it, so a download that keeps
+    running (TorrentStream windows) isn't reported done forever.
+    """
+
+    def __init__(self, url="ws://localhost:6800/jsonrpc"):
+        self.url = url
+        self.connected = False
+        self._task = None
+        self._waiters = {}              # gid -> {asyncio.Event}
+        self._recent = OrderedDict()    # gid -> last terminal event
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def wait(self, gid, timeout):
+        """Returns "complete"/"error"/"removed" if aria2 said so, None on timeout."""
+        self.start()
+        if gid in self._recent:
+            return self._recent.pop(gid)
+
+        event = asyncio.Event()
+        self._waiters.setdefault(gid, set()).add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(gid)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[gid]
+        return self._recent.pop(gid, None)
+
+    def discard(self, gid):
+        """Drop a pending event, e.g. when a download is given new files to fetch."""
+        self._recent.pop(gid, None)
+
+    async def _listen(self):
+        import websockets
+
+        backoff = 1
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=30, max_size=2**20) as ws:
+                    self.connected = True
+                    backoff = 1
+                    logger.info("🔔 Subscribed to aria2 notifications")
+                    async for raw in ws:
+                        self._dispatch(raw)
+            except asyncio.CancelledError:
+                self.connected = False
+                raise
+            except Exception as e:
+                logger.debug(f"aria2 WebSocket dropped: {e}")
+            self.connected = False
+            # Waiters fall back to slow polling while we reconnect
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _dispatch(self, raw):
+        try:
+            msg = json.loads(raw)
+        except ValueError:
+            return
+        kind = DONE_EVENTS.get(msg.get("method"))
+        if not kind:
+            return
+
+        for param in msg.get("params") or []:
+            gid = param.get("gid")
+            if not gid:
+                continue
+            self._recent[gid] = kind
+            self._recent.move_to_end(gid)
+            while len(self._recent) > RECENT_EVENTS:
+                self._recent.popitem(last=False)
+
+            for event in self._waiters.get(gid, ()):
+                event.set()
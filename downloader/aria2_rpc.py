@@ -0,0 +1,174 @@
+import asyncio
+import itertools
+import logging
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Everything get_status() needs, nothing more (keeps multicall replies small)
+STATUS_KEYS = [
+    "gid", "status", "totalLength", "completedLength", "downloadSpeed",
+    "uploadSpeed", "connections", "numSeeders", "followedBy",
+    "errorMessage", "bittorrent", "files", "dir", "infoHash"
+]
+
+
+class Aria2Error(Exception):
+    pass
+
+
+class Aria2RPC:
+    """
+    Minimal async aria2 JSON-RPC client on one pooled keep-alive connection.
+    Never blocks the event loop (unlike aria2p).
+    """
+
+    def __init__(self, url="http://localhost:6800/jsonrpc", secret=""):
+        self.url = url
+        self.secret = secret
+        self._ids = itertools.count(1)
+        self._client = None
+
+    def _http(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(10.0, connect=3.0),
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=2)
+            )
+        return self._client
+
+    def _params(self, params):
+        params = list(params)
+        return [f"token:{self.secret}"] + params if self.secret else params
+
+    async def call(self, method, *params):
+        payload = {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": self._params(params)}
+        resp = await self._http().post(self.url, json=payload)
+        data = resp.json()
+        if "error" in data:
+            raise Aria2Error(data["error"].get("message", "aria2 error"))
+        return data.get("result")
+
+    async def multicall(self, calls):
+        """
+        calls: [(method, [params...]), ...] -> one round-trip.
+        Returns one entry per call: the result, or an Aria2Error instance.
+        """
+        if not calls:
+            return []
+        batch = [{"methodName": m, "params": self._params(p)} for m, p in calls]
+        # system.multicall itself never takes the token
+        payload = {"jsonrpc": "2.0", "id": next(self._ids), "method": "system.multicall", "params": [batch]}
+        resp = await self._http().post(self.url, json=payload)
+        data = resp.json()
+        if "error" in data:
+            raise Aria2Error(data["error"].get("message", "aria2 error"))
+
+        out = []
+        for item in data.get("result") or []:
+            if isinstance(item, list):
+                out.append(item[0] if item else None)
+            else:
+                out.append(Aria2Error(item.get("faultString", "aria2 fault")))
+        return out
+
+    # -------------------------
+    # Helpers
+    # -------------------------
+
+    async def add_uri(self, uris, options=None):
+        return await self.call("aria2.addUri", uris, options or {})
+
+    async def tell_status(self, gid, keys=STATUS_KEYS):
+        return await self.call("aria2.tellStatus", gid, keys)
+
+    async def get_files(self, gid):
+        return await self.call("aria2.getFiles", gid)
+
+    async def change_option(self, gid, options):
+        return await self.call("aria2.changeOption", gid, options)
+
+    async def unpause(self, gid):
+        return await self.call("aria2.unpause", gid)
+
+    async def get_option(self, gid):
+        return await self.call("aria2.getOption", gid)
+
+    async def get_uris(self, gid):
+        return await self.call("aria2.getUris", gid)
+
+    async def change_global_option(self, options):
+        return await self.call("aria2.changeGlobalOption", options)
+
+    async def remove(self, gid):
+        try:
+            return await self.call("aria2.remove", gid)
+        except Aria2Error:
+            return await self.call("aria2.forceRemove", gid)
+
+    async def remove_result(self, gid):
+        try:
+            await self.call("aria2.removeDownloadResult", gid)
+        except Aria2Error:
+            pass
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+
+
+class StatusPoller:
+    """
+    One system.multicall per tick for every GID someone is watching,
+    fanned out to all waiters. Cost stays flat with N downloads.
+    """
+
+    def __init__(self, rpc, interval=10):
+        self.rpc = rpc
+        self.interval = interval
+        self._waiters = {}          # gid -> [Future]
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def next(self, gid):
+        """Status dict from the next tick (None if aria2 no longer knows the GID)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(gid, []).append(fut)
+        self._wakeup.set()
+        try:
+            return await fut
+        finally:
+            waiters = self._waiters.get(gid)
+            if waiters and fut in waiters:
+                waiters.remove(fut)
+                if not waiters:
+                    del self._waiters[gid]
+
+    async def _run(self):
+        while True:
+            if not self._waiters:
+                # Idle: no downloads in flight -> no RPC traffic at all
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            await asyncio.sleep(self.interval)
+            batch = dict(self._waiters)
+            self._waiters = {}
+            if not batch:
+                continue
+
+            gids = list(batch)
+            try:
+                replies = await self.rpc.multicall([("aria2.tellStatus", [g, STATUS_KEYS]) for g in gids])
+            except Exception as e:
+                logger.debug(f"Status poll failed: {e}")
+                replies = [None] * len(gids)
+
+            for gid, reply in zip(gids, replies):
+                status = None if isinstance(reply, Exception) else reply
+                for fut in batch[gid]:
+                    if not fut.done():
+                        fut.set_result(status)
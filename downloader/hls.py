@@ -0,0 +1,167 @@
+import os
+import re
+import asyncio
+import logging
+from urllib.parse import urljoin, urlsplit
+from utils.http_client import get_http_client
+from processor.hls import concat_segments, remux_url
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_CONCURRENCY = 6
+SEGMENT_RETRIES = 3
+SEGMENT_TIMEOUT = 30
+CHUNK = 256 * 1024
+
+_ATTR = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def _attrs(line):
+    return {k: v.strip('"') for k, v in _ATTR.findall(line.split(":", 1)[1] if ":" in line else "")}
+
+
+def parse_playlist(text, base_url):
+    """
+    Master playlist -> {"variants": [{"uri", "height", "bandwidth"}]}
+    Media playlist  -> {"segments": [uri...], "init": uri|None, "encrypted": bool}
+    """
+    lines = [l.strip() for l in text.splitlines() if l.strip()]
+
+    if any(l.startswith("#EXT-X-STREAM-INF") for l in lines):
+        variants, pending = [], None
+        for line in lines:
+            if line.startswith("#EXT-X-STREAM-INF"):
+                pending = _attrs(line)
+            elif pending is not None and not line.startswith("#"):
+                res = pending.get("RESOLUTION", "")
+                height = int(res.split("x")[1]) if "x" in res else 0
+                variants.append({
+                    "uri": urljoin(base_url, line),
+                    "height": height,
+                    "bandwidth": int(pending.get("BANDWIDTH", "0") or 0)
+                })
+                pending = None
+        return {"variants": variants}
+
+    segments, init, encrypted = [], None, False
+    for line in lines:
+        if line.startswith("#EXT-X-MAP"):
+            init = urljoin(base_url, _attrs(line).get("URI", ""))
+        elif line.startswith("#EXT-X-KEY"):
+            encrypted = encrypted or _attrs(line).get("METHOD", "NONE") != "NONE"
+        elif line.startswith("#EXT-X-BYTERANGE"):
+            encrypted = True   # byte-range playlists: let ffmpeg deal with it
+        elif not line.startswith("#"):
+            segments.append(urljoin(base_url, line))
+    return {"segments": segments, "init": init, "encrypted": encrypted}
+
+
+def referer_headers(referer):
+    """Most anime CDNs only serve the stream to their own embed page."""
+    if not referer:
+        return {}
+    parts = urlsplit(referer)
+    return {"Referer": referer, "Origin": f"{parts.scheme}://{parts.netloc}"}
+
+
+def pick_variant(variants, quality=None):
+    """'720p sub' -> the best variant not taller than 720p (else the smallest above)."""
+    if not variants:
+        return None
+    match = re.search(r"(\d{3,4})p", quality or "")
+    ordered = sorted(variants, key=lambda v: (v["height"], v["bandwidth"]))
+    if not match:
+        return ordered[-1]
+
+    target = int(match.group(1))
+    fitting = [v for v in ordered if v["height"] and v["height"] <= target]
+    return fitting[-1] if fitting else ordered[0]
+
+
+class HLSDownloader:
+    """
+    Playlist -> variant for the chosen quality -> segments fetched in parallel
+    straight to disk -> ffmpeg stream-copy into one file. Nothing big in RAM.
+    """
+
+    def __init__(self, concurrency=SEGMENT_CONCURRENCY):
+        self.concurrency = concurrency
+
+    async def download(self, url, output_path, quality=None, progress=None, referer=None):
+        client = get_http_client()
+        headers = referer_headers(referer)
+        playlist = await self._playlist(client, url, headers)
+
+        if "variants" in playlist:
+            variant = pick_variant(playlist["variants"], quality)
+            if not variant:
+                return False
+            logger.info(f"HLS variant {variant['height']}p @ {variant['bandwidth']}bps")
+            url = variant["uri"]
+            playlist = await self._playlist(client, url, headers)
+
+        if not playlist["segments"]:
+            return False
+
+        if playlist["encrypted"]:
+            # AES/byte-range streams: ffmpeg's own HLS demuxer handles keys
+            ok, _ = await remux_url(url, output_path, headers=headers)
+            return ok
+
+        parts_dir = output_path + ".parts"
+        os.makedirs(parts_dir, exist_ok=True)
+
+        paths = [os.path.join(parts_dir, f"{i:06d}.seg") for i in range(len(playlist["segments"]))]
+        jobs = list(zip(playlist["segments"], paths))
+        init_path = None
+        if playlist["init"]:
+            init_path = os.path.join(parts_dir, "init.seg")
+            jobs.insert(0, (playlist["init"], init_path))
+
+        done = 0
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(seg_url, path):
+            nonlocal done
+            async with slots:
+                await self._fetch_segment(client, seg_url, path, headers)
+            done += 1
+            if progress:
+                await progress(done, len(jobs))
+
+        tasks = [asyncio.create_task(fetch(u, p)) for u, p in jobs]
+        try:
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            logger.error(f"HLS segment download failed: {e}")
+            for t in tasks: t.cancel()
+            return False
+
+        ok, _ = await concat_segments(paths, output_path, init_path=init_path)
+        return ok
+
+    async def _playlist(self, client, url, headers):
+        resp = await client.get(url, headers=headers)
+        # A 403/404 HTML page would otherwise parse as "no segments"
+        resp.raise_for_status()
+        return parse_playlist(resp.text, url)
+
+    async def _fetch_segment(self, client, url, path, headers=None):
+        if os.path.exists(path):
+            return   # finished on a previous attempt (resume)
+
+        tmp = path + ".tmp"
+        for attempt in range(SEGMENT_RETRIES):
+            try:
+                async with client.stream("GET", url, headers=headers, timeout=SEGMENT_TIMEOUT) as resp:
+                    resp.raise_for_status()
+                    with open(tmp, "wb") as f:
+                        async for chunk in resp.aiter_bytes(CHUNK):
+                            f.write(chunk)
+                os.replace(tmp, path)
+                return
+            except Exception as e:
+                if attempt == SEGMENT_RETRIES - 1:
+                    raise
+                logger.debug(f"Segment retry {attempt + 1} for {url}: {e}")
+                await asyncio.sleep(2 * (attempt + 1))
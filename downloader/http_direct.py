@@ -0,0 +1,99 @@
+import re
+import logging
+from urllib.parse import urlsplit
+from utils.http_client import get_http_client
+
+logger = logging.getLogger(__name__)
+
+MiB = 1024 * 1024
+MIN_SEGMENT = 8 * MiB       # don't split below this per connection
+MAX_SPLIT = 16              # aria2's max-connection-per-server ceiling
+DEFAULT_HOST_CONNECTIONS = 8
+PROBE_TIMEOUT = 8
+
+# Hosts that throttle or ban on too many parallel connections
+HOST_CONNECTIONS = {
+    "pixeldrain": 4,
+    "gofile": 4,
+    "mp4upload": 4,
+    "krakenfiles": 4,
+    "streamtape": 2,
+    "dood": 2,
+}
+
+HLS_TYPES = ("mpegurl",)
+PAGE_TYPES = ("text/html", "application/xhtml")
+
+
+def classify_link(link):
+    """magnet | torrent | hls | http | unknown"""
+    low = link.strip().lower()
+    if low.startswith("magnet:"):
+        return "magnet"
+    if not low.startswith(("http://", "https://")):
+        return "unknown"
+    path = urlsplit(low).path
+    if path.endswith(".torrent"):
+        return "torrent"
+    if path.endswith(".m3u8"):
+        return "hls"
+    return "http"
+
+
+async def probe(url):
+    """
+    Ask the server about the file without downloading it.
+    Returns {"size", "ranges", "content_type", "url"} (url = after redirects) or None.
+    """
+    client = get_http_client()
+    try:
+        resp = await client.head(url, timeout=PROBE_TIMEOUT)
+        if resp.status_code in (403, 405, 501):
+            # Some hosts refuse HEAD; a 1-byte range GET tells us the same
+            resp = await client.get(url, headers={"Range": "bytes=0-0"}, timeout=PROBE_TIMEOUT)
+        if resp.status_code >= 400:
+            return None
+    except Exception as e:
+        logger.debug(f"Probe failed for {url}: {e}")
+        return None
+
+    headers = resp.headers
+    size = 0
+    ranges = headers.get("accept-ranges", "").lower() == "bytes" or resp.status_code == 206
+    match = re.search(r"/(\d+)$", headers.get("content-range", ""))
+    if match:
+        size = int(match.group(1))
+    elif headers.get("content-length", "").isdigit() and resp.status_code != 206:
+        size = int(headers["content-length"])
+
+    return {
+        "size": size,
+        "ranges": ranges,
+        "content_type": headers.get("content-type", "").lower(),
+        "url": str(resp.url)
+    }
+
+
+def host_connections(url):
+    """Most parallel connections this host tolerates before throttling / banning."""
+    host = urlsplit(url).netloc.lower()
+    return next((n for key, n in HOST_CONNECTIONS.items() if key in host), DEFAULT_HOST_CONNECTIONS)
+
+
+def segment_options(url, size, ranges):
+    """aria2 addUri options for a direct file: segments sized to the file and host."""
+    per_host = host_connections(url)
+
+    if not ranges or size <= MIN_SEGMENT:
+        split = 1
+    else:
+        split = max(1, min(MAX_SPLIT, per_host, size // MIN_SEGMENT))
+
+    return {
+        "split": str(split),
+        "max-connection-per-server": str(min(split, MAX_SPLIT)),
+        "min-split-size": f"{MIN_SEGMENT // MiB}M",
+        "continue": "true",          # resumable after a restart / retry
+        "max-tries": "5",
+        "retry-wait": "3"
+    }
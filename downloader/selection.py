@@ -0,0 +1,78 @@
+import os
+import re
+
+VIDEO_EXTS = (".mkv", ".mp4", ".avi")
+SUB_EXTS = (".srt", ".ass", ".vtt")
+
+# Batch torrents pad the real episodes with creditless OP/EDs, previews, scans...
+JUNK = re.compile(
+    r"\b(NC ?OP|NC ?ED|creditless|OP ?\d*|ED ?\d*|PV ?\d*|CM ?\d*|preview|trailer|teaser|"
+    r"menu|sample|extras?|bonus|scans?|specials?|SP ?\d*)\b",
+    re.IGNORECASE
+)
+ENGLISH = re.compile(r"(^|[._\s\-\[(])(en|eng|english)([._\s\-\])]|$)", re.IGNORECASE)
+JUNK_DIRS = re.compile(r"(^|/)(extras?|bonus|scans?|specials?|NC ?OP|NC ?ED|menus?|CDs?|OSTs?)(/|$)", re.IGNORECASE)
+
+
+def parse_range(text):
+    """'1-12' / '5' / '3,5,7-9' -> {1..12} / {5} / {3,5,7,8,9}; None = everything."""
+    if not text:
+        return None
+    wanted = set()
+    for part in re.split(r"[,\s]+", text.strip()):
+        match = re.fullmatch(r"(\d+)(?:-(\d+))?", part)
+        if not match:
+            continue
+        lo = int(match.group(1))
+        hi = int(match.group(2) or lo)
+        wanted.update(range(min(lo, hi), max(lo, hi) + 1))
+    return wanted or None
+
+
+def file_episode(path):
+    """'[Group] Anime S2 - 12v2 [1080p].mkv' -> 12 (None if no episode number)."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    name = re.sub(r"\[.*?\]|\(.*?\)", " ", name)
+    match = re.search(r"(?:S\d+E|\bE(?:p(?:isode)?)?[ ._]?|\s-\s*)(\d{1,4})(?:v\d)?\b", name, re.IGNORECASE)
+    if not match:
+        # Last bare number that isn't a resolution or a year
+        nums = [n for n in re.findall(r"(?<![\dx])(\d{1,4})(?![\dp])", name) if not re.fullmatch(r"(19|20)\d\d", n)]
+        return int(nums[-1]) if nums else None
+    return int(match.group(1))
+
+
+def _is_junk(rel_path):
+    name = os.path.splitext(os.path.basename(rel_path))[0]
+    name = re.sub(r"\[.*?\]|\(.*?\)", " ", name)
+    return bool(JUNK_DIRS.search(os.path.dirname(rel_path)) or JUNK.search(name))
+
+
+def _subs_for(video, subs):
+    """'Ep01.en.ass' next to 'Ep01.mkv', else same episode number (packs with a Subs/ folder); English first."""
+    stem = os.path.splitext(video[1])[0]
+    # 'Show - 1.en' belongs to 'Show - 1', 'Show - 10' does not
+    found = [s for s in subs if os.path.splitext(s[1])[0] == stem or s[1].startswith(stem + ".")]
+    ep = file_episode(video[1])
+    if not found and ep is not None:
+        found = [s for s in subs if file_episode(s[1]) == ep]
+    return sorted(found, key=lambda s: not ENGLISH.search(os.path.basename(s[1])))
+
+
+def pick_groups(files, ep_range=None):
+    """
+    aria2 getFiles reply -> the episode videos to keep (optionally only
+    `ep_range`), each with its subtitles, in episode order:
+    [{"video": (index, path, length), "subs": [(index, path, length), ...]}, ...]
+    Falls back to every video if the junk filter would leave nothing.
+    """
+    entries = [(int(f["index"]), f["path"], int(f.get("length", 0))) for f in files]
+    videos = [e for e in entries if e[1].lower().endswith(VIDEO_EXTS)]
+
+    keep = [v for v in videos if not _is_junk(v[1])] or videos
+    if ep_range:
+        keep = [v for v in keep if file_episode(v[1]) in ep_range]
+    keep.sort(key=lambda v: (file_episode(v[1]) is None, file_episode(v[1]) or 0, v[1]))
+
+    subs = [e for e in entries if e[1].lower().endswith(SUB_EXTS)]
+    return [{"video": v, "subs": _subs_for(v, subs)} for v in keep]
+
@@ -1,46 +1,568 @@
-import aria2p
 import os
+import time
 import asyncio
+from collections import deque
 from config import Config
+from downloader.aria2_events import Aria2Notifier
+from downloader.aria2_rpc import Aria2RPC, Aria2Error, StatusPoller
+from downloader.http_direct import (
+    classify_link, probe, segment_options, host_connections, PAGE_TYPES, HLS_TYPES, MAX_SPLIT, MiB
+)
+from utils.http_client import get_http_client
+from downloader.hls import HLSDownloader
+from downloader.selection import pick_groups
+
+ARIA2_HOST = "localhost"
+ARIA2_PORT = 6800
+
+# Completion is pushed over the WebSocket; this poll only refreshes progress
+PROGRESS_INTERVAL = 10
+# Dead magnets never deliver metadata; don't hold a job slot forever
+METADATA_TIMEOUT = 15 * 60
+# Season packs: episodes selected in aria2 at any one time (= peak disk in files)
+STREAM_WINDOW = 2
+
+# Adaptive tuning
+TUNE_INTERVAL = 30              # seconds between samples
+TUNE_COOLDOWN = 120             # don't touch the same GID / knob again sooner
+SLOW_HTTP = 1 * MiB             # direct downloads below this (avg) get more connections
+SEED_UPLOAD_CAP = "50K"         # finished torrents: share a little, not the whole uplink
+BUSY_UPLOAD_CAP = "256K"        # all torrents while Telegram uploads need the uplink
+BASE_CONCURRENCY = 5            # matches the Dockerfile's --max-concurrent-downloads
+BUSY_CONCURRENCY = 2
+TRACKER_REFRESH = 12 * 3600
+DECISION_LOG_SIZE = 50
+
+def _human(size, suffix=""):
+    size = float(size or 0)
+    for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+        if size < 1024.0: return f"{size:.2f} {unit}{suffix}"
+        size /= 1024.0
+    return f"{size:.2f} PiB{suffix}"
+
+def _eta(remaining, speed):
+    if not speed or remaining <= 0: return "N/A"
+    secs = int(remaining / speed)
+    h, rem = divmod(secs, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}h{m:02d}m" if h else f"{m}m{s:02d}s"
+
+def _name(raw):
+    info = (raw.get("bittorrent") or {}).get("info") or {}
+    if info.get("name"):
+        return info["name"]
+    files = raw.get("files") or []
+    if files and files[0].get("path"):
+        return os.path.basename(files[0]["path"])
+    if files and files[0].get("uris"):
+        return os.path.basename(files[0]["uris"][0]["uri"].split("?")[0])
+    return raw.get("gid", "?")
+
+def format_status(raw):
+    """aria2 tellStatus reply -> the dict the handlers have always used."""
+    total = int(raw.get("totalLength", 0))
+    done = int(raw.get("completedLength", 0))
+    speed = int(raw.get("downloadSpeed", 0))
+    status = raw.get("status")
+
+    # BT downloads keep "active" while seeding; all bytes on disk = done for us
+    if status == "active" and total and done >= total:
+        status = "complete"
+
+    return {
+        "gid": raw.get("gid"),
+        "name": _name(raw),
+        "progress": round(done / total * 100, 2) if total else 0.0,
+        "size": _human(total),
+        "speed": _human(speed, "/s"),
+        "eta": _eta(total - done, speed),
+        "status": status,
+        "followed_by": raw.get("followedBy") or [],
+        "total_length": total,
+        "completed_length": done,
+        "error": raw.get("errorMessage"),
+        "info_hash": raw.get("infoHash")
+    }
+
+class TorrentStream:
+    """
+    A season pack fetched one episode at a time. Only the next `window`
+    episodes are selected in aria2; each finished video (+ subtitles) is
+    handed out in episode order, and once the caller is done with it the
+    file is deselected and deleted before the window moves on.
+    Time-to-first-episode is one file, peak disk is `window` files.
+    """
+
+    def __init__(self, downloader, gid, groups, window=STREAM_WINDOW):
+        self.dl = downloader
+        self.gid = gid
+        self.groups = groups
+        self.window = window
+        self.failed = None    # "removed" / "error" if aria2 stopped mid-pack
+
+    def peak_bytes(self):
+        """Most disk the pack ever needs at once: the biggest window plus one mux copy."""
+        sizes = [sum(size for _, _, size in [g["video"], *g["subs"]]) for g in self.groups]
+        window = max(sum(sizes[i:i + self.window]) for i in range(len(sizes)))
+        return window + max(g["video"][2] for g in self.groups)
+
+    async def files(self, progress=None):
+        """Yields (video_index, [video_path, *subtitle_paths]) per episode, in order."""
+        pending = list(self.groups)
+        # seed-ratio 0.0 keeps the download "active" after the window completes,
+        # so select-file can still be changed (a stopped download can't)
+        await self._select(pending, {"seed-ratio": "0.0"})
+        try:
+            await self.dl.rpc.unpause(self.gid)
+        except Aria2Error:
+            pass
+
+        while pending:
+            group = pending[0]
+            if not await self._wait_for(group, len(self.groups) - len(pending), progress):
+                return
+            paths = [p for _, p, _ in [group["video"], *group["subs"]]]
+            yield group["video"][0], paths
+
+            # Caller is done with it: move the window, then free the disk
+            pending.pop(0)
+            if pending:
+                await self._select(pending)
+            else:
+                await self.dl.remove_download(self.gid)
+            for path in paths:
+                await asyncio.to_thread(_remove_file, path)
+
+    async def _select(self, pending, extra=None):
+        active = pending[:self.window]
+        indexes = sorted(i for g in active for i, _, _ in [g["video"], *g["subs"]])
+        await self.dl.rpc.change_option(
+            self.gid, {"select-file": ",".join(map(str, indexes)), **(extra or {})}
+        )
+        # The previous window's "complete" no longer applies
+        self.dl.notifier.discard(self.gid)
+
+    async def _wait_for(self, group, done_count, progress):
+        wanted = {i for i, _, _ in [group["video"], *group["subs"]]}
+        while True:
+            status = await self.dl.get_status(self.gid)
+            if not status or status["status"] in ("error", "removed"):
+                self.failed = status["status"] if status else "error"
+                return False
+
+            files = {int(f["index"]): f for f in await self.dl.rpc.get_files(self.gid)}
+            have = sum(int(files[i]["completedLength"]) for i in wanted)
+            size = sum(int(files[i]["length"]) for i in wanted)
+            if size and have >= size:
+                return True
+
+            if progress:
+                pct = round(have / size * 100, 1) if size else 0.0
+                await progress(done_count, len(self.groups), pct, status["speed"])
+            await self.dl._next_status(self.gid)
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class Aria2Tuner:
+    """
+    Samples every active GID (speed, connections, seeders) plus the host's
+    uplink and adjusts aria2 at runtime instead of trusting the Dockerfile's
+    fixed flags:
+    - slow direct downloads get more connections (within the host's limit)
+    - torrents that are done downloading get their seeding capped
+    - while the uplink is saturated (Telegram uploads), aria2 runs fewer
+      downloads and seeds less, and both are restored once it frees up
+    - the static tracker list is refreshed from TRACKERS_URL
+    Every change lands in `decisions` with the reason.
+    """
+
+    def __init__(self, rpc, interval=TUNE_INTERVAL):
+        self.rpc = rpc
+        self.interval = interval
+        self.decisions = deque(maxlen=DECISION_LOG_SIZE)
+        self._speeds = {}          # gid -> deque of recent download speeds
+        self._touched = {}         # (gid | "global", knob) -> last change time
+        self._seed_capped = set()
+        self.ranges = {}           # gid -> server accepts Range (recorded at add time)
+        self._busy = False
+        self._net = None           # (time, bytes_sent) of the previous sample
+        self._uplink_peak = Config.UPLINK_MBPS * MiB / 8
+        self._trackers_at = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def snapshot(self, last=3):
+        return list(self.decisions)[-last:]
+
+    async def _run(self):
+        idle = 0
+        while idle < 3:
+            await asyncio.sleep(self.interval)
+            try:
+                active = await self.rpc.call("aria2.tellActive", [
+                    "gid", "status", "totalLength", "completedLength", "downloadSpeed",
+                    "uploadSpeed", "connections", "numSeeders", "infoHash"
+                ])
+                idle = 0 if active else idle + 1
+                for raw in active:
+                    await self._tune_download(raw)
+                self._forget_finished({raw["gid"] for raw in active})
+                await self._tune_uplink(active)
+                await self._refresh_trackers()
+            except Exception as e:
+                print(f"Tuner sample failed: {e}")
+
+        # Nothing downloading for a while: stop until the next add_torrent()
+        if self._busy:
+            self._busy = False
+            try:
+                await self._change_global({
+                    "max-concurrent-downloads": str(BASE_CONCURRENCY),
+                    "max-overall-upload-limit": "0"
+                }, "idle, back to defaults")
+            except Exception as e:
+                print(f"Tuner reset failed: {e}")
+
+    # -------------------------
+    # Rules
+    # -------------------------
+
+    async def _tune_download(self, raw):
+        gid = raw["gid"]
+        total, done = int(raw.get("totalLength", 0)), int(raw.get("completedLength", 0))
+        speeds = self._speeds.setdefault(gid, deque(maxlen=3))
+        speeds.append(int(raw.get("downloadSpeed", 0)))
+
+        if raw.get("infoHash"):
+            finished = bool(total) and done >= total
+            if finished and gid not in self._seed_capped and int(raw.get("uploadSpeed", 0)) > 0:
+                await self._change(gid, "max-upload-limit", SEED_UPLOAD_CAP,
+                                   f"download done, seeding at {_human(raw['uploadSpeed'], '/s')}")
+                self._seed_capped.add(gid)
+            elif not finished and gid in self._seed_capped:
+                # TorrentStream moved its window on: downloading again, reciprocate fully
+                await self._change(gid, "max-upload-limit", "0", "downloading again (new files selected)")
+                self._seed_capped.discard(gid)
+            return
+
+        # Changing split restarts the download; without Range support that means from byte 0
+        if self.ranges.get(gid) is False:
+            return
+
+        # Direct HTTP: judge on a full window of samples, skip nearly-done files
+        avg = sum(speeds) / len(speeds)
+        if len(speeds) < speeds.maxlen or avg >= SLOW_HTTP or total - done < 64 * MiB:
+            return
+        if not self._cooled(gid, "split"):
+            return
+
+        options = await self.rpc.get_option(gid)
+        current = int(options.get("split", 1))
+        # split=1 is what segment_options() gives servers that can't be split
+        # (also covers GIDs resumed from the session, which have no ranges entry)
+        if current <= 1:
+            return
+        uris = await self.rpc.get_uris(gid)
+        cap = min(MAX_SPLIT, host_connections(uris[0]["uri"])) if uris else MAX_SPLIT
+        target = min(cap, current * 2)
+        if target > current:
+            await self._change(gid, ("split", "max-connection-per-server"), str(target),
+                               f"slow mirror {_human(avg, '/s')} on {raw.get('connections')} conns, {current}->{target}")
+
+    async def _tune_uplink(self, active):
+        rate = self._uplink_rate()
+        if rate is None:
+            return
+        self._uplink_peak = max(self._uplink_peak, rate)
+        # Saturated: sending near the best rate this host has shown
+        busy = self._uplink_peak > 1 * MiB and rate >= 0.8 * self._uplink_peak
+        if busy == self._busy or not self._cooled("global", "uplink"):
+            return
+
+        self._busy = busy
+        if busy:
+            await self._change_global({
+                "max-concurrent-downloads": str(BUSY_CONCURRENCY),
+                "max-overall-upload-limit": BUSY_UPLOAD_CAP
+            }, f"uplink saturated ({_human(rate, '/s')} of ~{_human(self._uplink_peak, '/s')})")
+        else:
+            await self._change_global({
+                "max-concurrent-downloads": str(BASE_CONCURRENCY),
+                "max-overall-upload-limit": "0"
+            }, f"uplink free again ({_human(rate, '/s')})")
+
+    async def _refresh_trackers(self):
+        if not Config.TRACKERS_URL or time.time() - self._trackers_at < TRACKER_REFRESH:
+            return
+        self._trackers_at = time.time()
+        try:
+            resp = await get_http_client().get(Config.TRACKERS_URL)
+            trackers = [t.strip() for t in resp.text.splitlines() if t.strip()]
+        except Exception as e:
+            print(f"Tracker refresh failed: {e}")
+            return
+        if trackers:
+            await self._change_global({"bt-tracker": ",".join(trackers)}, f"refreshed {len(trackers)} trackers")
+
+    # -------------------------
+    # Helpers
+    # -------------------------
+
+    def _forget_finished(self, live):
+        for gid in set(self._speeds) - live:
+            self._speeds.pop(gid, None)
+            self._seed_capped.discard(gid)
+            self.ranges.pop(gid, None)
+        for key in [k for k in self._touched if k[0] != "global" and k[0] not in live]:
+            del self._touched[key]
+
+    def _uplink_rate(self):
+        try:
+            import psutil
+            sent = psutil.net_io_counters().bytes_sent
+        except Exception:
+            return None
+        now = time.monotonic()
+        prev, self._net = self._net, (now, sent)
+        if not prev or now <= prev[0]:
+            return None
+        return (sent - prev[1]) / (now - prev[0])
+
+    def _cooled(self, target, knob):
+        return time.monotonic() - self._touched.get((target, knob), 0) >= TUNE_COOLDOWN
+
+    async def _change(self, gid, knobs, value, reason):
+        knobs = (knobs,) if isinstance(knobs, str) else knobs
+        await self.rpc.change_option(gid, {k: value for k in knobs})
+        self._touched[(gid, knobs[0])] = time.monotonic()
+        self._log(gid, {k: value for k in knobs}, reason)
+
+    async def _change_global(self, options, reason):
+        await self.rpc.change_global_option(options)
+        self._touched[("global", "uplink")] = time.monotonic()
+        self._log("global", options, reason)
+
+    def _log(self, target, options, reason):
+        # Tracker lists are long; the log only needs to say they changed
+        shown = {k: (v if len(v) < 40 else f"<{len(v.split(','))} entries>") for k, v in options.items()}
+        entry = {"at": time.time(), "target": target, "options": shown, "reason": reason}
+        self.decisions.append(entry)
+        print(f"🎛️ aria2 [{target}] {shown}: {reason}")
 
 class TorrentDownloader:
     def __init__(self):
-        self.aria2 = aria2p.API(
-            aria2p.Client(
-                host="http://localhost",
-                port=6800,
-                secret=""
-            )
-        )
+        self.rpc = Aria2RPC(f"http://{ARIA2_HOST}:{ARIA2_PORT}/jsonrpc", secret="")
+        self.poller = StatusPoller(self.rpc, interval=PROGRESS_INTERVAL)
+        self.notifier = Aria2Notifier(f"ws://{ARIA2_HOST}:{ARIA2_PORT}/jsonrpc")
+        self.tuner = Aria2Tuner(self.rpc)
 
-    async def add_torrent(self, magnet_or_link):
+    async def add_torrent(self, magnet_or_link, metadata_first=False):
+        """
+        Start any supported link and return its GID:
+        magnets / .torrent go to BitTorrent, direct HTTP(S) files get a
+        segmented, resumable download sized from a HEAD probe.
+        metadata_first: the real torrent download starts paused, so
+        open_stream() can trim it before any payload is fetched.
+        """
         try:
-            download = self.aria2.add_magnet(magnet_or_link)
-            return download.gid
+            kind = classify_link(magnet_or_link)
+            if kind in ("magnet", "torrent"):
+                options = {"pause-metadata": "true"} if metadata_first else {}
+                gid = await self.rpc.add_uri([magnet_or_link], options)
+            elif kind == "unknown":
+                gid = await self.rpc.add_uri([magnet_or_link])
+            elif kind == "hls":
+                print(f"HLS playlist, use download_hls(): {magnet_or_link}")
+                return None
+            else:
+                gid = await self._add_http(magnet_or_link)
+
+            if gid:
+                self.notifier.start()
+                self.tuner.start()
+            return gid
         except Exception as e:
             print(f"Error adding torrent: {e}")
             return None
 
+    async def _add_http(self, url):
+        info = await probe(url)
+        if not info:
+            return None
+
+        # An HTML page is an episode page, not a file -> let the resolver handle it
+        if any(t in info["content_type"] for t in PAGE_TYPES):
+            return None
+        if any(t in info["content_type"] for t in HLS_TYPES):
+            print(f"HLS playlist, use download_hls(): {url}")
+            return None
+
+        options = segment_options(info["url"], info["size"], info["ranges"])
+        gid = await self.rpc.add_uri([info["url"]], options)
+        if gid:
+            self.tuner.ranges[gid] = info["ranges"]
+        return gid
+
+    async def can_download(self, link):
+        """True if the link is a file/stream we can fetch directly (no resolver needed)."""
+        kind = classify_link(link)
+        if kind in ("magnet", "torrent", "hls"):
+            return True
+        if kind != "http":
+            return False
+        info = await probe(link)
+        return bool(info) and not any(t in info["content_type"] for t in PAGE_TYPES)
+
+    async def is_hls(self, link):
+        kind = classify_link(link)
+        if kind != "http":
+            return kind == "hls"
+        info = await probe(link)
+        return bool(info) and any(t in info["content_type"] for t in HLS_TYPES)
+
+    async def download_hls(self, url, output_path, quality=None, progress=None, referer=None):
+        """
+        HLS streams bypass aria2: parallel segments + ffmpeg stream copy.
+        `referer`: the episode / embed page the stream was found on.
+        """
+        try:
+            return await HLSDownloader().download(url, output_path, quality=quality, progress=progress, referer=referer)
+        except Exception as e:
+            print(f"HLS download failed: {e}")
+            return False
+
     async def get_status(self, gid):
         try:
-            download = self.aria2.get_download(gid)
-            return {
-                "name": download.name,
-                "progress": download.progress,
-                "size": download.total_length_string(),
-                "speed": download.download_speed_string(),
-                "status": download.status
-            }
+            return format_status(await self.rpc.tell_status(gid))
         except Exception as e:
             print(f"Error getting status: {e}")
             return None
 
+    async def is_alive(self, gid):
+        """A GID from before a restart is only worth re-attaching to if aria2 still runs it."""
+        status = await self.get_status(gid)
+        return bool(status) and status["status"] not in ("error", "removed")
+
+    async def forget(self, gid):
+        # Drop a finished download from aria2's memory (and its saved session)
+        try:
+            await self.rpc.remove_result(gid)
+        except Exception:
+            pass
+
+    async def wait_for_metadata(self, gid, timeout=METADATA_TIMEOUT):
+        """Magnet / .torrent GID -> GID of the (paused) payload download, or None."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                raw = await self.rpc.tell_status(gid, ["status", "followedBy", "bittorrent"])
+            except Exception as e:
+                print(f"Error getting status: {e}")
+                return None
+            if raw.get("followedBy"):
+                # Followed: drop the magnet entry, or --force-save keeps restoring it
+                await self.forget(gid)
+                return raw["followedBy"][0]
+            if (raw.get("bittorrent") or {}).get("info"):
+                # Already the payload download (e.g. re-adopted after a restart)
+                return gid
+            if raw.get("status") in ("error", "removed", "complete"):
+                return None
+            await self._next_status(gid)
+        return None
+
+    async def download_roots(self):
+        """
+        Top-level names (under aria2's dir) of every download aria2 still
+        has queued or running, e.g. restored from its session. None if
+        aria2 can't be asked.
+        """
+        roots = set()
+        try:
+            raws = await self.rpc.call("aria2.tellActive", ["dir", "files"])
+            raws += await self.rpc.call("aria2.tellWaiting", 0, 1000, ["dir", "files"])
+        except Exception as e:
+            print(f"Error listing downloads: {e}")
+            return None
+        for raw in raws:
+            for f in raw.get("files", []):
+                if f.get("path"):
+                    roots.add(os.path.relpath(f["path"], raw.get("dir", ".")).split(os.sep)[0])
+        return roots
+
+    async def expected_size(self, link):
+        """Bytes a direct link will take on disk (None: unknown until metadata / HLS)."""
+        if classify_link(link) != "http":
+            return None
+        info = await probe(link)
+        return info["size"] if info and info.get("size") else None
+
+    async def open_stream(self, gid, ep_range=None, skip=(), window=STREAM_WINDOW):
+        """
+        Paused payload GID -> TorrentStream over the wanted episodes, minus
+        the video indexes in `skip` (already handed off before a restart).
+        None if nothing is left.
+        """
+        groups = [g for g in pick_groups(await self.rpc.get_files(gid), ep_range) if g["video"][0] not in skip]
+        return TorrentStream(self, gid, groups, window) if groups else None
+
+    async def downloaded_files(self, gid):
+        """
+        {video_path: [subtitle_paths]} of a finished download in episode order,
+        straight from aria2 (no directory walk).
+        """
+        try:
+            files = await self.rpc.get_files(gid)
+        except Exception as e:
+            print(f"Error listing files: {e}")
+            return None
+        done = [
+            f for f in files
+            if f.get("selected") == "true" and int(f.get("completedLength", 0)) >= int(f.get("length", 0))
+        ]
+        return {g["video"][1]: [p for _, p, _ in g["subs"]] for g in pick_groups(done)}
+
+    async def remove_download(self, gid):
+        await self.rpc.remove(gid)
+        await self.rpc.remove_result(gid)
+
+    async def _next_status(self, gid):
+        # Whichever comes first: aria2's push notification or the shared poll tick
+        tick = asyncio.create_task(self.poller.next(gid))
+        push = asyncio.create_task(self.notifier.wait(gid, timeout=PROGRESS_INTERVAL * 3))
+        done, pending = await asyncio.wait({tick, push}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+
+        if tick in done and tick.result():
+            return format_status(tick.result())
+        return await self.get_status(gid)
+
     async def wait_for_completion(self, gid, callback=None):
-        while True:
-            status = await self.get_status(gid)
-            if not status:
-                break
-            
+        """
+        Sleeps until aria2 notifies us (or the shared poller ticks, for the
+        progress callback). Returns the GID that holds the real files, which
+        differs from `gid` for magnets (metadata download -> followed_by).
+        """
+        status = await self.get_status(gid)
+        while status:
+            if status["status"] == "complete" and status.get("followed_by"):
+                await self.forget(gid)
+                gid = status["followed_by"][0]
+                status = await self.get_status(gid)
+                continue
+
             if callback:
                 await callback(status)
             
@@ -49,5 +571,13 @@ class TorrentDownloader:
             elif status["status"] == "error":
                 print("Download failed")
                 break
+            elif status["status"] == "removed":
+                break
             
-            await asyncio.sleep(5)
+            status = await self._next_status(gid)
+        return gid
+
+    async def close(self):
+        await self.tuner.stop()
+        await self.notifier.stop()
+        await self.rpc.close()
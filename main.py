@@ -17,12 +17,20 @@ from bot.handlers import (
     stats_command, 
     button_callback, 
     set_thumb_command, 
-    broadcast_command
+    broadcast_command,
+    resume_jobs,
+    run_job,
+    cancel_download,
+    downloader
 )
+from bot.jobs import job_queue, sweep_stale_downloads
+from telegram import Bot
 
 # --- IMPORT MEMORY MANAGER & DB ---
 from utils.memory_manager import start_memory_manager
 from database.mongo import db # <--- NEW IMPORT
+from utils.safe_browser import warm_browser_pool, close_browser_pool
+from utils.http_client import close_http_client
 
 # --- SILENT LOGGING SETUP ---
 logging.basicConfig(
@@ -49,12 +57,46 @@ async def health_check():
     return {
         "status": "active", 
         "bot": Config.BOT_USERNAME, 
-        "platform": "Koyeb/Docker"
+        "platform": "Koyeb/Docker",
+        "mode": Config.BOT_MODE,
+        "worker": Config.WORKER_ID
     }
 
 def run_web_server():
     uvicorn.run(app, host="0.0.0.0", port=Config.PORT, log_level="critical")
 
+async def on_startup(application):
+    # Front-ends don't download; their queued jobs belong to the workers
+    if Config.BOT_MODE == "frontend":
+        return
+    # Leftovers first, then pick up whatever the last process didn't finish
+    await asyncio.to_thread(sweep_stale_downloads, keep=await downloader.download_roots() or ())
+    await resume_jobs(application.bot)
+
+async def on_shutdown(application):
+    await close_browser_pool()
+    await close_http_client()
+    await downloader.close()
+
+# --- WORKER MODE ---
+async def run_worker():
+    """No Telegram polling: claim jobs from the shared queue and run them."""
+    await db.init_indexes()
+    await asyncio.to_thread(sweep_stale_downloads, keep=await downloader.download_roots() or ())
+    asyncio.create_task(start_memory_manager())
+    asyncio.create_task(warm_browser_pool())
+
+    print(f"🛠️ Worker {Config.WORKER_ID} started ({Config.WORKER_JOBS} job slots)...")
+    async with Bot(Config.BOT_TOKEN) as bot:
+        try:
+            await job_queue.serve(
+                lambda job: run_job(job, bot), Config.WORKER_JOBS, on_cancel=cancel_download
+            )
+        finally:
+            await close_browser_pool()
+            await close_http_client()
+            await downloader.close()
+
 # --- MAIN BOT EXECUTION ---
 def main():
     # 1. Start Web Server
@@ -67,8 +109,22 @@ def main():
         time.sleep(3600)
         return
 
+    if Config.BOT_MODE == "worker":
+        if db.db is None:
+            logger.error("❌ Worker mode needs MONGO_URL (the shared job queue).")
+            time.sleep(3600)
+            return
+        asyncio.run(run_worker())
+        return
+
     # 3. Initialize Bot
-    application = ApplicationBuilder().token(Config.BOT_TOKEN).build()
+    application = (
+        ApplicationBuilder()
+        .token(Config.BOT_TOKEN)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 
     # 4. Register All Commands
     application.add_handler(CommandHandler("start", start))
@@ -84,8 +140,11 @@ def main():
     loop = asyncio.get_event_loop()
     loop.create_task(db.init_indexes())      # <--- MOVED HERE
     loop.create_task(start_memory_manager()) # <--- ALREADY HERE
+    loop.create_task(warm_browser_pool())    # Chromium ready before first /search
 
-    print(f"🚀 Bot Started as @{Config.BOT_USERNAME}...")
+    if Config.BOT_MODE == "frontend" and db.db is None:
+        logger.warning("⚠️ Front-end mode without MONGO_URL: jobs will run locally.")
+    print(f"🚀 Bot Started as @{Config.BOT_USERNAME} ({Config.BOT_MODE} mode)...")
 
     # 6. Startup Loop
     while True:
@@ -0,0 +1,95 @@
+# processor/hls.py
+import os
+import shutil
+import logging
+import asyncio
+from utils.process_registry import process_registry
+
+logger = logging.getLogger(__name__)
+
+PIPE_CHUNK = 1024 * 1024
+
+
+def _output_args(output_path, fragmented):
+    args = ["-map", "0", "-c", "copy"]
+    # MPEG-TS carries ADTS AAC; MP4 wants it as AudioSpecificConfig
+    if output_path.lower().endswith(".mp4") and not fragmented:
+        args += ["-bsf:a", "aac_adtstoasc"]
+    if output_path.lower().endswith(".mp4"):
+        args += ["-movflags", "+faststart"]
+    return args
+
+
+async def _run(cmd, feed=None):
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if feed else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    # Lets the memory governor pause this ffmpeg instead of killing it
+    process_registry.register(proc.pid, f"hls {cmd[-1]}")
+    # Drained while we feed stdin: a full stderr pipe would block ffmpeg and our drain() with it
+    err_task = asyncio.create_task(proc.stderr.read())
+    try:
+        if feed:
+            try:
+                await feed(proc.stdin)
+            except (BrokenPipeError, ConnectionResetError):
+                pass   # ffmpeg bailed out; its stderr says why
+            finally:
+                proc.stdin.close()
+        err = await err_task
+        await proc.wait()
+    except asyncio.CancelledError:
+        proc.kill()
+        err_task.cancel()
+        # Reap it: no zombie left behind
+        await proc.wait()
+        raise
+    finally:
+        process_registry.unregister(proc.pid)
+    return proc.returncode == 0, err.decode("utf-8", "ignore")[-2000:]
+
+
+async def concat_segments(segment_paths, output_path, init_path=None, cleanup=True):
+    """
+    Stream-copy downloaded HLS segments into one MP4/MKV.
+    Segments are piped into ffmpeg one by one (no re-encode, no joined temp file).
+    """
+    async def feed(stdin):
+        for path in ([init_path] if init_path else []) + list(segment_paths):
+            with open(path, "rb") as f:
+                while chunk := f.read(PIPE_CHUNK):
+                    stdin.write(chunk)
+                    await stdin.drain()
+
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", "pipe:0"]
+    cmd += _output_args(output_path, fragmented=bool(init_path)) + [output_path]
+
+    ok, err = await _run(cmd, feed)
+    if ok:
+        logger.info(f"HLS remux success: {output_path}")
+        if cleanup:
+            parts = os.path.dirname(segment_paths[0]) if segment_paths else None
+            if parts and parts.endswith(".parts"):
+                await asyncio.to_thread(shutil.rmtree, parts, True)
+    else:
+        logger.error(f"HLS remux failed: {err}")
+    return ok, None if ok else err
+
+
+async def remux_url(playlist_url, output_path, headers=None):
+    """
+    Let ffmpeg fetch the playlist itself (encrypted / byte-range streams).
+    `headers` (Referer / Origin) go on the playlist, key and segment requests.
+    """
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+    if headers:
+        cmd += ["-headers", "".join(f"{k}: {v}\r\n" for k, v in headers.items())]
+    cmd += ["-i", playlist_url]
+    cmd += _output_args(output_path, fragmented=False) + [output_path]
+    ok, err = await _run(cmd)
+    if not ok:
+        logger.error(f"HLS remux failed: {err}")
+    return ok, None if ok else err
@@ -1,72 +1,182 @@
 # processor/muxer.py
-import ffmpeg
 import os
 import logging
 import asyncio
+from utils.process_registry import process_registry
 
 # Configure logger specifically for the muxer
 logger = logging.getLogger(__name__)
 
-def _mux_subtitles_sync(video_path, subtitle_path, output_path):
+MAX_MUXES = 2                       # hard ceiling, whatever the box looks like
+MUX_COST = 60 * 1024 * 1024         # rough RSS of one stream-copy ffmpeg
+RECHECK_SECONDS = 5
+SUB_CODECS = {".srt": "srt", ".vtt": "webvtt", ".ass": "ass"}
+
+
+class MuxCancelled(Exception):
+    """The download this mux belongs to was cancelled by the user."""
+
+
+class MuxSlots:
     """
-    Synchronous mux function (blocking), wrapped by asyncio for async usage.
+    Concurrency limit for ffmpeg: at most one per core (and MAX_MUXES),
+    and only as many as the memory left under the safe limit can hold.
+    Waiters re-check every few seconds because memory frees up on its own.
     """
+
+    def __init__(self, limit=MAX_MUXES):
+        self.limit = limit
+        self.running = 0
+        self._cond = asyncio.Condition()
+
+    def capacity(self):
+        cpus = os.cpu_count() or 1
+        try:
+            from utils.memory_manager import TOTAL_MEM_LIMIT, SAFE_MEM_RATIO, used_memory
+            # Running muxes are children, so their RSS is already in used_memory()
+            free = TOTAL_MEM_LIMIT * SAFE_MEM_RATIO - used_memory()
+            by_mem = self.running + max(0, int(free // MUX_COST))
+        except Exception:
+            by_mem = self.limit
+        # One mux always gets through, or a full box would never drain
+        return max(1, min(self.limit, cpus, by_mem))
+
+    async def __aenter__(self):
+        async with self._cond:
+            while self.running >= self.capacity():
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=RECHECK_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            self.running += 1
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.running -= 1
+            self._cond.notify_all()
+
+
+mux_slots = MuxSlots()
+
+
+def _build_cmd(video_path, subtitle_path, output_path):
+    # Determine subtitle codec
+    ext = os.path.splitext(subtitle_path)[1].lower()
+    if output_path.lower().endswith(".mp4"):
+        subtitle_codec = "mov_text"
+    else:
+        subtitle_codec = SUB_CODECS.get(ext, "srt")
+
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-progress", "pipe:1", "-y",
+        "-i", video_path, "-i", subtitle_path,
+        "-c:v", "copy", "-c:a", "copy", "-c:s", subtitle_codec,
+        "-metadata:s:s:0", "language=eng",
+        output_path
+    ]
+
+
+async def probe_duration(path):
+    """Container duration in seconds (None if ffprobe can't tell)."""
     try:
-        # Validation
-        if not os.path.exists(video_path):
-            return False, f"Video file not found: {video_path}"
-        if not os.path.exists(subtitle_path):
-            return False, f"Subtitle file not found: {subtitle_path}"
-
-        # Determine subtitle codec
-        ext = os.path.splitext(subtitle_path)[1].lower()
-        if output_path.lower().endswith(".mp4"):
-            subtitle_codec = "mov_text"
-        elif ext in [".srt", ".vtt", ".ass"]:
-            subtitle_codec = ext[1:]
-        else:
-            subtitle_codec = "srt"
+        proc = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        out, _ = await proc.communicate()
+        return float(out.decode().strip()) or None
+    except (ValueError, OSError):
+        return None
+
+
+async def _read_progress(stream, duration, progress):
+    """ffmpeg -progress emits key=value blocks; out_time_us is how far it got."""
+    last = -1
+    while line := await stream.readline():
+        key, _, value = line.decode("utf-8", "ignore").strip().partition("=")
+        if key not in ("out_time_us", "out_time_ms") or not duration or not progress:
+            continue
+        try:
+            # out_time_ms is microseconds too (long-standing ffmpeg quirk)
+            pct = min(100, int(int(value) / 1e6 / duration * 100))
+        except ValueError:
+            continue
+        if pct != last:
+            last = pct
+            try:
+                await progress(pct)
+            except Exception:
+                pass
 
-        logger.info(f"Starting mux: {os.path.basename(video_path)} + {os.path.basename(subtitle_path)}")
 
-        # Build FFmpeg command
-        input_video = ffmpeg.input(video_path)
-        input_sub = ffmpeg.input(subtitle_path)
-
-        (
-            ffmpeg
-            .output(
-                input_video,
-                input_sub,
-                output_path,
-                vcodec='copy',
-                acodec='copy',
-                scodec=subtitle_codec,
-                **{'metadata:s:s:0': 'language=eng'}
+async def mux_subtitles(video_path, subtitle_path, output_path, progress=None, key=None):
+    """
+    Mux a subtitle file into a video (stream copy) without blocking the loop.
+    `progress(pct)` is awaited as ffmpeg advances; `key` (the download GID)
+    lets a cancel button kill this mux. Returns (success, error).
+    Raises MuxCancelled if that happened.
+    """
+    # Validation
+    if not os.path.exists(video_path):
+        return False, f"Video file not found: {video_path}"
+    if not os.path.exists(subtitle_path):
+        return False, f"Subtitle file not found: {subtitle_path}"
+
+    duration = await probe_duration(video_path) if progress else None
+
+    async with mux_slots:
+        logger.info(f"Starting mux: {os.path.basename(video_path)} + {os.path.basename(subtitle_path)}")
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *_build_cmd(video_path, subtitle_path, output_path),
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
             )
-            .global_args('-hide_banner', '-loglevel', 'error')
-            .overwrite_output()
-            .run(capture_stdout=True, capture_stderr=True)
-        )
+        except OSError as e:
+            logger.error(f"General Muxing Error: {str(e)}")
+            return False, str(e)
 
-        logger.info(f"Muxing success: {output_path}")
-        return True, None
+        process_registry.register(proc.pid, f"mux {os.path.basename(video_path)}", key)
+        reader = asyncio.create_task(_read_progress(proc.stdout, duration, progress))
+        try:
+            err = await proc.stderr.read()
+            await proc.wait()
+            await reader
+        except asyncio.CancelledError:
+            proc.kill()
+            reader.cancel()
+            await proc.wait()
+            _remove_partial(output_path)
+            raise
+        finally:
+            cancelled = process_registry.was_cancelled(proc.pid)
+            process_registry.unregister(proc.pid)
 
-    except ffmpeg.Error as e:
-        error_message = e.stderr.decode('utf-8') if e.stderr else str(e)
+    if cancelled:
+        _remove_partial(output_path)
+        raise MuxCancelled(f"Mux of {os.path.basename(video_path)} cancelled")
+
+    if proc.returncode != 0:
+        error_message = err.decode("utf-8", "ignore")[-2000:] or f"ffmpeg exited with {proc.returncode}"
         logger.error(f"FFmpeg failed: {error_message}")
+        _remove_partial(output_path)
         return False, error_message
-    except Exception as e:
-        logger.error(f"General Muxing Error: {str(e)}")
-        return False, str(e)
 
+    logger.info(f"Muxing success: {output_path}")
+    return True, None
 
-async def mux_subtitles(video_path, subtitle_path, output_path):
-    """
-    Async wrapper for muxing subtitles into a video.
-    This prevents blocking the bot's main event loop.
-    """
-    return await asyncio.to_thread(_mux_subtitles_sync, video_path, subtitle_path, output_path)
+
+def cancel_mux(key):
+    """Kill the muxes started for a download GID. Returns how many were running."""
+    return process_registry.cancel(key)
+
+
+def _remove_partial(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
 
 
 # --- Testing Block (Optional) ---
@@ -77,8 +187,11 @@ if __name__ == "__main__":
     sub = sys.argv[2] if len(sys.argv) > 2 else "test.srt"
     out = sys.argv[3] if len(sys.argv) > 3 else "output_test.mp4"
 
+    async def show(pct):
+        print(f"⏳ {pct}%", end="\r")
+
     async def test():
-        success, err = await mux_subtitles(video, sub, out)
+        success, err = await mux_subtitles(video, sub, out, progress=show)
         if success:
             print(f"✅ Mux successful: {out}")
         else:
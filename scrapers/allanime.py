@@ -1,7 +1,11 @@
 # intelligent_scraper.py
 import asyncio
+import re
+import time
 import logging
 from utils.safe_browser import get_safe_browser
+from scrapers.extract import extract_items
+from utils.memory_manager import browser_tab_budget
 
 logger = logging.getLogger(__name__)
 
@@ -11,6 +15,42 @@ TRUSTED_HOSTS = [
     "filemoon.com", "mp4upload.com"
 ]
 
+# Anything that is clearly the video itself
+MEDIA_URL = re.compile(r"\.(m3u8|mpd|mp4|mkv)(\?|$)", re.IGNORECASE)
+MEDIA_CONTENT_TYPES = ("mpegurl", "dash+xml", "video/")
+
+RESOLVE_DEADLINE = 20    # seconds for the whole resolve
+CLICK_SETTLE = 1.5       # max wait for traffic after each click
+
+# One round-trip: every clickable element with the hints we rank on
+_CANDIDATES_JS = """
+() => Array.from(document.querySelectorAll('a, button')).map((el, i) => ({
+    i,
+    text: (el.innerText || el.textContent || '').trim().toLowerCase().slice(0, 80),
+    href: (el.getAttribute('href') || '').toLowerCase(),
+    visible: !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length)
+}))
+"""
+
+
+def is_target_url(url):
+    low = url.lower()
+    return any(host in low for host in TRUSTED_HOSTS) or bool(MEDIA_URL.search(low))
+
+
+def score_candidate(c):
+    """Higher = more likely to lead to the file."""
+    score = 0
+    text, href = c["text"], c["href"]
+    if any(host in href for host in TRUSTED_HOSTS): score += 10
+    if MEDIA_URL.search(href): score += 8
+    if "download" in text or "download" in href: score += 5
+    if any(w in text for w in ("mirror", "server", "mp4", "1080", "720")): score += 2
+    if any(w in text for w in ("login", "sign", "share", "comment", "home")): score -= 3
+    if href.startswith(("javascript:void", "#")) and not text: score -= 2
+    if not c["visible"]: score -= 4
+    return score
+
 class IntelligentScraper:
     def __init__(self, sites=None):
         # List of anime search sites
@@ -20,58 +60,132 @@ class IntelligentScraper:
         ]
 
     async def search(self, query, top_n=5):
-        """Return top search results for the query."""
-        async with get_safe_browser() as page:
-            results = []
-            for site in self.sites:
-                try:
-                    search_url = f"{site['search_url']}{query.replace(' ', '+')}"
-                    await page.goto(search_url, wait_until="domcontentloaded", timeout=30000)
-                    await asyncio.sleep(1)
-
-                    # Find clickable items for anime results
-                    candidates = await page.query_selector_all("a, .item, .film-name, .name")
-                    for el in candidates[:top_n]:
-                        title = await el.inner_text()
-                        link = await el.get_attribute("href")
-                        if link.startswith("/"):
-                            base = site['search_url'].split("/search")[0]
-                            link = f"{base}{link}"
-                        results.append({"title": f"[{site['name']}] {title.strip()}", "url": link})
-                except Exception as e:
-                    logger.warning(f"Search failed on {site['name']}: {e}")
-            return results
+        """Return top search results for the query (one tab per site, in parallel)."""
+        tabs = asyncio.Semaphore(browser_tab_budget())
+
+        async def probe(site):
+            async with tabs:
+                return await self._search_site(site, query, top_n)
+
+        results = []
+        tasks = [asyncio.create_task(probe(site)) for site in self.sites]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                results.extend(await next_done)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return results
+
+    async def _search_site(self, site, query, top_n):
+        try:
+            async with get_safe_browser() as page:
+                search_url = f"{site['search_url']}{query.replace(' ', '+')}"
+                await page.goto(search_url, wait_until="domcontentloaded", timeout=30000)
+                await asyncio.sleep(1)
 
-    async def resolve_download(self, anime_page_url, max_clicks=10):
+                # Find clickable items for anime results
+                base = site['search_url'].split("/search")[0]
+                candidates = await extract_items(
+                    page, "a, .item, .film-name, .name", title=None, link=None, base_url=base, limit=top_n
+                )
+                return [{"title": f"[{site['name']}] {item['title']}", "url": item['url']} for item in candidates]
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Search failed on {site['name']}: {e}")
+            return []
+
+    async def resolve_download(self, anime_page_url, max_clicks=10, deadline=RESOLVE_DEADLINE):
         """
-        Opens the anime page and intelligently clicks buttons
-        until a trusted download link is found.
+        Opens the anime page and listens to its network traffic (requests,
+        responses, popups) while clicking the most promising elements.
+        Returns as soon as anything hits a trusted host or a media manifest.
         """
+        loop = asyncio.get_running_loop()
+        found = loop.create_future()
+        popups = []
+        started = time.monotonic()
+
+        def offer(url):
+            if url and not found.done() and is_target_url(url):
+                found.set_result(url)
+
+        def on_response(resp):
+            ctype = (resp.headers.get("content-type") or "").lower()
+            if any(t in ctype for t in MEDIA_CONTENT_TYPES) and not found.done():
+                found.set_result(resp.url)
+            else:
+                offer(resp.url)
+
+        def watch(p):
+            p.on("request", lambda req: offer(req.url))
+            p.on("response", on_response)
+            p.on("framenavigated", lambda frame: offer(frame.url))
+
+        def on_popup(p):
+            popups.append(p)
+            watch(p)
+            offer(p.url)
+
+        def remaining():
+            return deadline - (time.monotonic() - started)
+
+        async def wait_found(timeout):
+            if timeout <= 0:
+                return None
+            try:
+                return await asyncio.wait_for(asyncio.shield(found), timeout)
+            except asyncio.TimeoutError:
+                return None
+
         async with get_safe_browser() as page:
+            watch(page)
+            page.on("popup", on_popup)
             try:
-                await page.goto(anime_page_url, wait_until="domcontentloaded", timeout=30000)
-                await asyncio.sleep(1)
+                try:
+                    await page.goto(anime_page_url, wait_until="domcontentloaded", timeout=min(30000, deadline * 1000))
+                except Exception as e:
+                    # The embed may already have fired while the page was loading
+                    if not found.done():
+                        raise e
+
+                if found.done():
+                    return found.result()
+
+                candidates = await page.evaluate(_CANDIDATES_JS)
+                ranked = sorted(candidates, key=score_candidate, reverse=True)[:max_clicks]
 
-                candidates = await page.query_selector_all("a, button")
-                for idx, el in enumerate(candidates[:max_clicks]):
+                # Direct hrefs to a host we trust need no click at all
+                for c in ranked:
+                    if is_target_url(c["href"]):
+                        return await page.evaluate(
+                            "i => document.querySelectorAll('a, button')[i].href", c["i"]
+                        )
+
+                elements = await page.query_selector_all("a, button")
+                for c in ranked:
+                    if remaining() <= 0 or found.done():
+                        break
                     try:
-                        await el.scroll_into_view_if_needed()
-                        await el.click()
-                        await asyncio.sleep(2)
-
-                        # Check main page URL
-                        url = page.url.lower()
-                        if any(host in url for host in TRUSTED_HOSTS):
-                            return url
-
-                        # Check all open pages (popups)
-                        for p in page.context.pages:
-                            p_url = p.url.lower()
-                            if any(host in p_url for host in TRUSTED_HOSTS):
-                                return p_url
-                    except:
+                        el = elements[c["i"]]
+                        await el.click(timeout=2000, no_wait_after=True)
+                    except Exception:
                         continue
-                return None
+
+                    url = await wait_found(min(CLICK_SETTLE, remaining()))
+                    if url:
+                        return url
+                    offer(page.url)
+
+                return await wait_found(min(CLICK_SETTLE, remaining())) if not found.done() else found.result()
             except Exception as e:
                 logger.error(f"Download resolution failed: {e}")
-                return None
+                return found.result() if found.done() else None
+            finally:
+                for p in popups:
+                    try:
+                        if not p.is_closed():
+                            await p.close()
+                    except Exception:
+                        pass
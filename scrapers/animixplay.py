@@ -1,35 +1,38 @@
 # animixplay.py
 import asyncio
 from utils.safe_browser import get_safe_browser
+from scrapers.http_tier import http_scrape
+from scrapers.extract import extract_items
+from scrapers.episodes import episode_number, take_newer
+
+BASE_URL = "https://animixplay.by"
+
+# Shared by the HTTP tier and the browser tier
+SEARCH_SPEC = {"selectors": ".result-item, .item", "title": ".title, .name", "link": "a", "base_url": BASE_URL, "limit": 10}
+EPISODE_SPEC = {"selectors": ".episodes a, .episode-list a", "title": None, "link": None, "base_url": BASE_URL}
 
 async def scrape_animixplay(query):
     """Search AnimixPlay and return top anime results."""
+    search_url = f"{BASE_URL}/?s={query.replace(' ', '+')}"
+
+    # Static HTML -> try plain HTTP before paying for a browser page
+    items = await http_scrape(search_url, **SEARCH_SPEC)
+    if items is not None:
+        return [{"title": f"[AniMix] {i['title']}", "url": i["url"], "type": "video"} for i in items]
+
     try:
         async with get_safe_browser() as page:
-            search_url = f"https://animixplay.by/?s={query.replace(' ', '+')}"
             await page.goto(search_url, wait_until="domcontentloaded", timeout=60000)
             
             results = []
             try:
-                await page.wait_for_selector(".result-item, .item", timeout=10000)
-                elements = await page.query_selector_all(".result-item, .item")
-                
-                for element in elements[:10]:  # Top 10 results
-                    title_el = await element.query_selector(".title, .name")
-                    link_el = await element.query_selector("a")
-                    
-                    if title_el and link_el:
-                        title = await title_el.inner_text()
-                        link = await link_el.get_attribute("href")
-                        
-                        if link.startswith("/"):
-                            link = f"https://animixplay.by{link}"
-                        
-                        results.append({
-                            "title": f"[AniMix] {title.strip()}",
-                            "url": link,
-                            "type": "video"  # Indicates episode page
-                        })
+                await page.wait_for_selector(SEARCH_SPEC["selectors"], timeout=10000)
+                for item in await extract_items(page, **SEARCH_SPEC):  # Top 10 results
+                    results.append({
+                        "title": f"[AniMix] {item['title']}",
+                        "url": item["url"],
+                        "type": "video"  # Indicates episode page
+                    })
             except Exception:
                 pass
             
@@ -40,40 +43,26 @@ async def scrape_animixplay(query):
 
 
 # --- Extract episodes for selected anime ---
-async def get_animixplay_episodes(anime_url):
+async def get_animixplay_episodes(anime_url, after=0):
     """
-    Given an anime page, return a list of episodes with URLs.
+    Given an anime page, return a list of episodes with URLs
+    (only those numbered above `after`, if given).
     """
-    try:
-        async with get_safe_browser() as page:
-            await page.goto(anime_url, wait_until="domcontentloaded", timeout=60000)
-            
-            # AnimixPlay uses a "Play" button / episode list
-            await page.wait_for_selector(".episodes a, .episode-list a", timeout=10000)
-            ep_elements = await page.query_selector_all(".episodes a, .episode-list a")
-            
-            episodes = []
-            for ep in ep_elements:
-                ep_title = await ep.inner_text()
-                ep_link = await ep.get_attribute("href")
-                
-                if ep_link.startswith("/"):
-                    ep_link = f"https://animixplay.by{ep_link}"
+    items = await http_scrape(anime_url, **EPISODE_SPEC, after=after)
+    if items is None:
+        try:
+            async with get_safe_browser() as page:
+                await page.goto(anime_url, wait_until="domcontentloaded", timeout=60000)
                 
-                episodes.append({
-                    "title": ep_title.strip(),
-                    "url": ep_link,
-                    "type": "video"
-                })
-            
-            # Sort episodes numerically if possible
-            def ep_key(e):
-                import re
-                match = re.search(r"\d+", e["title"])
-                return int(match.group()) if match else 0
-            episodes.sort(key=ep_key)
-            
-            return episodes
-    except Exception as e:
-        print(f"AniMixPlay Episode Extraction Error: {e}")
-        return []
+                # AnimixPlay uses a "Play" button / episode list
+                await page.wait_for_selector(EPISODE_SPEC["selectors"], timeout=10000)
+                items = list(take_newer(await extract_items(page, **EPISODE_SPEC), after))
+        except Exception as e:
+            print(f"AniMixPlay Episode Extraction Error: {e}")
+            return []
+
+    episodes = [{"title": i["title"], "url": i["url"], "type": "video"} for i in items]
+
+    # Sort episodes numerically if possible
+    episodes.sort(key=episode_number)
+    return episodes
@@ -1,18 +1,26 @@
 # common_scraper.py
 import asyncio
-import random
+import time
 import logging
-from urllib.parse import urljoin
 from utils.safe_browser import get_safe_browser
+from scrapers.http_tier import http_scrape, tier_memory
+from scrapers.extract import extract_items
+from scrapers.site_health import site_health
+from scrapers.episodes import take_newer
+from utils.memory_manager import browser_tab_budget
 
 logger = logging.getLogger(__name__)
 
+HTTP_TIER_BUDGET = 8   # seconds for all serial HTTP attempts; the browser tier needs the rest of SEARCH_DEADLINE
+HTTP_TIMEOUT = 10
+
 class CommonAnimeScraper:
     """
-    Centralized scraper for multiple anime sites using SafeBrowser:
+    Centralized scraper for multiple anime sites (plain HTTP first, then SafeBrowser):
     - Ad & popup blocking
     - Stealth mode (Cloudflare bypass)
     - Automatic retries for blocked sites
+    - Adaptive site order + circuit breakers (see site_health)
     - Returns top 5 results per query
     """
 
@@ -30,98 +38,150 @@ class CommonAnimeScraper:
         Returns top 5 results per site.
         """
         results = []
-
+        started = {}
+
+        # Best expected payoff first; tripped sites are skipped until half-open
+        sites = site_health.order(self.sites)
+
+        # 1. Plain HTTP first (no Chromium needed for static pages)
+        browser_sites = []
+        http_deadline = time.monotonic() + HTTP_TIER_BUDGET
+        for site in sites:
+            remaining = http_deadline - time.monotonic()
+            if remaining < 1:
+                # Out of HTTP budget: straight to the browser tier
+                browser_sites.append(site)
+                continue
+            started[site['name']] = time.monotonic()
+            search_url = f"{site['url']}{site['search']}{query.replace(' ', '+')}"
+            tried_http = tier_memory.prefer_http(search_url)
+            items = await http_scrape(
+                search_url, site['selector'], site['title'], base_url=site['url'], limit=5,
+                timeout=min(HTTP_TIMEOUT, remaining)
+            )
+            if items is None:
+                if tried_http and not tier_memory.prefer_http(search_url):
+                    # fetch_static hit a 403/503 or a challenge page
+                    self._record(site, "blocked", started)
+                browser_sites.append(site)
+                continue
+
+            self._record(site, "ok", started)
+            results.extend(self._format(site, items))
+            if len(results) >= 5:
+                return results
+
+        if not browser_sites:
+            return results
+
+        # 2. Browser tier: blocked / JS-rendered sites on parallel tabs,
+        #    as many as the memory budget allows right now
+        tabs = asyncio.Semaphore(browser_tab_budget())
+
+        async def probe(site):
+            async with tabs:
+                # Browser-tier latency only, not the HTTP attempt or the wait for a tab
+                started[site['name']] = time.monotonic()
+                return site, await self._browser_search(site, query, started)
+
+        tasks = [asyncio.create_task(probe(site)) for site in browser_sites]
         try:
-            async with get_safe_browser() as page:
-                random.shuffle(self.sites)  # Avoid detection
-
-                for site in self.sites:
-                    try:
-                        search_url = f"{site['url']}{site['search']}{query.replace(' ', '+')}"
-                        logger.info(f"Searching {site['name']}: {search_url}")
-
-                        response = await page.goto(search_url, wait_until="domcontentloaded", timeout=15000)
-                        if response and response.status in [403, 503]:
-                            logger.warning(f"{site['name']} blocked (Status {response.status})")
-                            continue
-
-                        # Wait for results
-                        try:
-                            await page.wait_for_selector(site['selector'], timeout=5000)
-                        except:
-                            logger.debug(f"No results on {site['name']}")
-                            continue
-
-                        elements = await page.query_selector_all(site['selector'])
-                        for el in elements[:5]:  # top 5 per site
-                            title_el = await el.query_selector(site['title'])
-                            link_el = await el.query_selector("a")
-
-                            if title_el and link_el:
-                                title = await title_el.inner_text()
-                                link = await link_el.get_attribute("href")
-                                if link.startswith("/"):
-                                    link = urljoin(site['url'], link)
-
-                                results.append({
-                                    "title": f"[{site['name']}] {title.strip()}",
-                                    "url": link,
-                                    "type": "video"  # triggers episode fetch in handlers
-                                })
-
-                        # Stop early if enough results
-                        if len(results) >= 5:
-                            break
-
-                    except Exception as e:
-                        logger.error(f"Error scraping {site['name']}: {e}")
-                        continue
-
+            # Merge as each tab finishes; one slow site no longer blocks the rest
+            for next_done in asyncio.as_completed(tasks):
+                site, items = await next_done
+                results.extend(self._format(site, items))
+
+                # Stop early if enough results
+                if len(results) >= 5:
+                    break
         except Exception as e:
             logger.error(f"Critical Scraper Error: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
         return results
 
-    async def get_episodes(self, anime_url: str):
+    async def _browser_search(self, site, query, started):
+        search_url = f"{site['url']}{site['search']}{query.replace(' ', '+')}"
+        try:
+            async with get_safe_browser() as page:
+                logger.info(f"Searching {site['name']}: {search_url}")
+
+                response = await page.goto(search_url, wait_until="domcontentloaded", timeout=15000)
+                if response and response.status in [403, 503]:
+                    logger.warning(f"{site['name']} blocked (Status {response.status})")
+                    self._record(site, "blocked", started, response.status)
+                    return []
+
+                # Wait for results
+                try:
+                    await page.wait_for_selector(site['selector'], timeout=5000)
+                except:
+                    logger.debug(f"No results on {site['name']}")
+                    self._record(site, "empty", started)
+                    return []
+
+                items = await extract_items(
+                    page, site['selector'], site['title'], base_url=site['url'], limit=5  # top 5 per site
+                )
+
+                self._record(site, "ok" if items else "empty", started)
+                return items
+
+        except asyncio.CancelledError:
+            # Enough results came from faster sites
+            self._record(site, "timeout", started)
+            raise
+        except Exception as e:
+            logger.error(f"Error scraping {site['name']}: {e}")
+            self._record(site, "error", started)
+            return []
+
+    def _record(self, site, outcome, started, status=None):
+        site_health.record(site['name'], outcome, time.monotonic() - started[site['name']], status)
+
+    def _format(self, site, items):
+        return [
+            {
+                "title": f"[{site['name']}] {item['title']}",
+                "url": item['url'],
+                "type": "video"  # triggers episode fetch in handlers
+            }
+            for item in items
+        ]
+
+    async def get_episodes(self, anime_url: str, after: int = 0):
         """
-        Fetch all episodes from a given anime page URL.
+        Fetch all episodes from a given anime page URL (only those numbered
+        above `after`, if given).
         Returns a list of dicts: [{title, url, type='video'}]
         """
-        episodes = []
-        try:
-            async with get_safe_browser() as page:
-                await page.goto(anime_url, wait_until="domcontentloaded", timeout=20000)
-
-                # Try common episode selectors
-                selectors = [
-                    ".episode_list li a",       # 9Anime
-                    ".listing li a",            # AniGo
-                    ".film-list .episode a",    # Hianime / Aniwatch
-                    ".episodes a"
-                ]
-                ep_links = []
-                for sel in selectors:
-                    try:
-                        await page.wait_for_selector(sel, timeout=5000)
-                        ep_links = await page.query_selector_all(sel)
-                        if ep_links:
-                            break
-                    except:
-                        continue
+        # Try common episode selectors
+        selectors = [
+            ".episode_list li a",       # 9Anime
+            ".listing li a",            # AniGo
+            ".film-list .episode a",    # Hianime / Aniwatch
+            ".episodes a"
+        ]
 
-                for el in ep_links:
-                    title = await el.inner_text()
-                    link = await el.get_attribute("href")
-                    if link.startswith("/"):
-                        link = urljoin(anime_url, link)
+        items = await http_scrape(anime_url, selectors, title=None, link=None, after=after)
+        if items is None:
+            items = []
+            try:
+                async with get_safe_browser() as page:
+                    await page.goto(anime_url, wait_until="domcontentloaded", timeout=20000)
 
-                    episodes.append({
-                        "title": title.strip(),
-                        "url": link,
-                        "type": "video"
-                    })
+                    # One wait for whichever layout this site uses, then one extraction
+                    try:
+                        await page.wait_for_selector(", ".join(selectors), timeout=5000)
+                    except:
+                        pass
+                    items = await extract_items(page, selectors, title=None, link=None, base_url=anime_url)
+                    items = list(take_newer(items, after))
 
-        except Exception as e:
-            logger.error(f"Failed fetching episodes from {anime_url}: {e}")
+            except Exception as e:
+                logger.error(f"Failed fetching episodes from {anime_url}: {e}")
 
-        return episodes
+        return [{"title": i["title"], "url": i["url"], "type": "video"} for i in items]
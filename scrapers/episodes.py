@@ -0,0 +1,131 @@
+# episodes.py
+import asyncio
+import re
+import time
+import logging
+from datetime import datetime
+from database.mongo import db
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+EPISODE_REFRESH_SECONDS = 30 * 60   # re-check for new episodes after this
+EPISODE_MEMORY_ENTRIES = 64
+
+
+def episode_number(ep):
+    """
+    Best-effort episode number: an "Ep"/"Episode" token in the title, then
+    one in the URL, then the title's last number.
+    'Season 2 Episode 5' -> 5, '86 Ep 3' -> 3, '12' -> 12, no digits -> 0.
+    """
+    title = ep.get("title", "")
+    match = (
+        re.search(r"\bep(?:isode)?\.?\s*(\d+)", title, re.IGNORECASE) or
+        re.search(r"(?:episode[-_/]?|\bep-)(\d+)", ep.get("url", ""), re.IGNORECASE)
+    )
+    if match:
+        return int(match.group(1))
+    nums = re.findall(r"\d+", title)
+    return int(nums[-1]) if nums else 0
+
+
+def take_newer(items, after):
+    """
+    Lazily keep the episodes numbered above `after` (and unnumbered ones).
+    On a newest-first list the first known episode ends the walk, so the
+    rest of a long list is never looked at; oldest-first lists are skipped through.
+    """
+    seen_newer = False
+    for item in items:
+        n = episode_number(item)
+        if n and n <= after:
+            if seen_newer:
+                return
+            continue
+        seen_newer = True
+        yield item
+
+
+async def scrape_episodes(anime_url, after=0):
+    """Route an anime page to the scraper that understands it (`after`: only newer episodes)."""
+    if "gogoanime3" in anime_url:
+        from scrapers.gogoanime3 import get_gogoanime_episodes
+        return await get_gogoanime_episodes(anime_url, after)
+    elif "animixplay" in anime_url:
+        from scrapers.animixplay import get_animixplay_episodes
+        return await get_animixplay_episodes(anime_url, after)
+    else:
+        from scrapers.common_scraper import CommonAnimeScraper
+        return await CommonAnimeScraper().get_episodes(anime_url, after)
+
+
+class EpisodeIndex:
+    """
+    Persistent episode list per anime URL (memory -> Mongo -> scrape).
+    - Known episodes are never re-scraped; refreshes only append newer ones
+    - Concurrent lookups for the same title share a single scrape
+    """
+
+    def __init__(self, refresh_after=EPISODE_REFRESH_SECONDS):
+        self.refresh_after = refresh_after
+        self.memory = TTLCache(maxsize=EPISODE_MEMORY_ENTRIES)
+        self._inflight = {}   # anime_url -> shared scrape task
+
+    async def get(self, anime_url):
+        known, age = self.memory.get(anime_url)
+        if known is None:
+            known, age = await self._load(anime_url)
+
+        if known and age < self.refresh_after:
+            return known
+
+        task = self._inflight.get(anime_url)
+        if task is None:
+            task = asyncio.create_task(self._update(anime_url, known or []))
+            self._inflight[anime_url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(anime_url, None))
+
+        # shield: one impatient caller must not cancel everyone's scrape
+        return await asyncio.shield(task)
+
+    async def _load(self, anime_url):
+        doc = await db.get_episode_index(anime_url)
+        if not doc or not doc.get("episodes"):
+            return None, None
+
+        age = (datetime.utcnow() - doc["updated_at"]).total_seconds()
+        self.memory.set(anime_url, doc["episodes"], stored_at=time.time() - age)
+        return doc["episodes"], age
+
+    async def _update(self, anime_url, known):
+        max_known = max((episode_number(e) for e in known), default=0)
+        try:
+            # Refreshes only walk the list down to the newest known episode
+            scraped = await scrape_episodes(anime_url, after=max_known)
+        except Exception as e:
+            logger.error(f"Episode fetch error: {e}")
+            scraped = None
+
+        # By URL: episodes without a number in their title still get added once
+        known_urls = {e["url"] for e in known}
+        fresh = [e for e in scraped or [] if e["url"] not in known_urls]
+
+        if known and not fresh:
+            # Nothing new (or the site is down) -> keep serving what we have
+            self.memory.set(anime_url, known)
+            if scraped is not None:
+                await db.set_episode_index(anime_url, known, max_known)
+            return known
+
+        episodes = sorted(known + fresh, key=episode_number)
+        if episodes:
+            if known:
+                logger.info(f"Episode index: +{len(fresh)} new for {anime_url}")
+            max_ep = max(episode_number(e) for e in episodes)
+            self.memory.set(anime_url, episodes)
+            await db.set_episode_index(anime_url, episodes, max_ep)
+        return episodes
+
+
+episode_index = EpisodeIndex()
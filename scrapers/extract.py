@@ -0,0 +1,45 @@
+# extract.py
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Runs inside Chromium: walks every container and returns plain dicts,
+# so a whole result/episode list costs ONE round-trip instead of 3 per element.
+_EXTRACT_JS = """
+([selectors, title, link, base, limit]) => {
+    for (const sel of selectors) {
+        const out = [];
+        for (const el of document.querySelectorAll(sel)) {
+            const t = title ? el.querySelector(title) : el;
+            const a = link ? el.querySelector(link) : el;
+            const href = a && a.getAttribute('href');
+            if (!t || !href) continue;
+
+            let url;
+            try { url = new URL(href, base || document.baseURI).href; } catch (e) { continue; }
+
+            out.push({ title: (t.innerText || t.textContent || '').trim(), url });
+            if (limit && out.length >= limit) break;
+        }
+        if (out.length) return out;
+    }
+    return [];
+}
+"""
+
+
+async def extract_items(page, selectors, title=None, link="a", base_url=None, limit=None):
+    """
+    Declarative single-roundtrip extraction (browser twin of http_tier.parse_items).
+    - selectors: container selector, or a list tried in order (first match wins)
+    - title / link: sub-selectors inside the container; None = the container itself
+    - base_url: used to absolutize relative hrefs (defaults to the page URL)
+    Returns [{"title": ..., "url": ...}] with absolute URLs.
+    """
+    if isinstance(selectors, str):
+        selectors = [selectors]
+    try:
+        return await page.evaluate(_EXTRACT_JS, [selectors, title, link, base_url, limit or 0])
+    except Exception as e:
+        logger.debug(f"DOM extraction failed ({selectors}): {e}")
+        return []
@@ -0,0 +1,139 @@
+# http_tier.py
+import asyncio
+import itertools
+import time
+import logging
+from urllib.parse import urljoin, urlparse
+from bs4 import BeautifulSoup
+from utils.http_client import get_http_client
+from scrapers.episodes import take_newer
+
+logger = logging.getLogger(__name__)
+
+BLOCK_STATUS = (403, 503)
+CHALLENGE_MARKERS = (
+    "cf-chl", "challenge-platform", "just a moment...",
+    "attention required! | cloudflare", "cf-browser-verification"
+)
+HTTP_RETRY_AFTER = 30 * 60   # re-try plain HTTP on a "browser" site after this
+
+
+class TierMemory:
+    """
+    Remembers, per host, whether plain HTTP got blocked last time.
+    Only an actual block / challenge in fetch_static() marks a host; browser
+    successes don't, so the HTTP tier is re-probed every `retry_after`.
+    """
+
+    def __init__(self, retry_after=HTTP_RETRY_AFTER):
+        self.retry_after = retry_after
+        self._browser_since = {}   # host -> time the HTTP tier last failed
+
+    def prefer_http(self, url):
+        since = self._browser_since.get(_host(url))
+        return since is None or time.time() - since > self.retry_after
+
+    def record(self, url, tier):
+        if tier == "http":
+            self._browser_since.pop(_host(url), None)
+        else:
+            self._browser_since[_host(url)] = time.time()
+
+
+tier_memory = TierMemory()
+
+
+def _host(url):
+    return urlparse(url).netloc.lower()
+
+
+def is_challenge(html):
+    head = html[:5000].lower()
+    return any(m in head for m in CHALLENGE_MARKERS)
+
+
+async def fetch_static(url, timeout=10):
+    """
+    Fetch a page over plain HTTP.
+    Returns the HTML, or None when the browser tier should take over.
+    """
+    if not tier_memory.prefer_http(url):
+        return None
+
+    try:
+        resp = await get_http_client().get(url, timeout=timeout)
+    except Exception as e:
+        logger.debug(f"HTTP tier failed for {url}: {e}")
+        return None
+
+    if resp.status_code in BLOCK_STATUS or is_challenge(resp.text):
+        logger.info(f"HTTP tier blocked on {_host(url)} (Status {resp.status_code})")
+        tier_memory.record(url, "browser")
+        return None
+    if resp.status_code >= 400:
+        return None
+    return resp.text
+
+
+def _iter_items(soup, sel, title, link, base_url):
+    for el in soup.select(sel):
+        title_el = el.select_one(title) if title else el
+        link_el = el.select_one(link) if link else el
+        if not title_el or not link_el or not link_el.get("href"):
+            continue
+
+        yield {
+            "title": title_el.get_text(" ", strip=True),
+            "url": urljoin(base_url, link_el["href"])
+        }
+
+
+def _parse_items(html, selectors, title, link, base_url, limit, after=None):
+    """Returns (items, matched): matched with no items = only episodes up to `after`."""
+    soup = BeautifulSoup(html, "html.parser")
+    if isinstance(selectors, str):
+        selectors = [selectors]
+
+    for sel in selectors:
+        found = _iter_items(soup, sel, title, link, base_url)
+        first = next(found, None)
+        if first is None:
+            continue
+        found = itertools.chain([first], found)
+        if after:
+            # Stops walking a newest-first episode list at the first known one
+            found = take_newer(found, after)
+        return list(itertools.islice(found, limit or None)), True
+    return [], False
+
+
+async def parse_items(html, selectors, title=None, link="a", base_url="", limit=None, after=None):
+    """
+    Same container/title/link selectors the browser scrapers use.
+    title=None / link=None mean "the container element itself".
+    Several container selectors may be given; the first that matches wins.
+    after: episode lists only, keep just the episodes numbered above it.
+    """
+    # Parsing a 1000-episode page takes long enough to stall the bot
+    items, _ = await asyncio.to_thread(_parse_items, html, selectors, title, link, base_url, limit, after)
+    return items
+
+
+async def http_scrape(url, selectors, title=None, link="a", base_url=None, limit=None, timeout=10, after=None):
+    """
+    Fetch + parse in one go.
+    Returns a list on success, or None if the caller should fall back to Playwright.
+    With `after`, an empty list means the page has nothing newer.
+    """
+    html = await fetch_static(url, timeout=timeout)
+    if html is None:
+        return None
+
+    items, matched = await asyncio.to_thread(
+        _parse_items, html, selectors, title, link, base_url or url, limit, after
+    )
+    if not matched:
+        return None
+
+    tier_memory.record(url, "http")
+    return items
@@ -0,0 +1,133 @@
+# link_cache.py
+import asyncio
+import time
+import logging
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+from database.mongo import db
+from utils.cache import TTLCache
+from utils.http_client import get_http_client
+
+logger = logging.getLogger(__name__)
+
+# How long a resolved link stays usable, by host keyword (seconds)
+HOST_TTL = {
+    "mega": 30 * 24 * 3600,
+    "pixeldrain": 7 * 24 * 3600,
+    "1fichier": 24 * 3600,
+    "mediafire": 24 * 3600,
+    "gofile": 6 * 3600,
+    "mp4upload": 6 * 3600,
+    "send.cm": 6 * 3600,
+    "streamtape": 2 * 3600,
+    "dood": 2 * 3600,
+    "filemoon": 1 * 3600,
+}
+DEFAULT_TTL = 3 * 3600
+MANIFEST_TTL = 30 * 60      # signed .m3u8 / .mpd URLs die fast
+PROBE_TIMEOUT = 5
+
+
+def link_ttl(link):
+    low = link.lower()
+    if ".m3u8" in low or ".mpd" in low:
+        return MANIFEST_TTL
+    host = urlparse(low).netloc
+    for keyword, ttl in HOST_TTL.items():
+        if keyword in host:
+            return ttl
+    return DEFAULT_TTL
+
+
+async def probe_link(link):
+    """Cheap liveness check before we hand a cached link to aria2."""
+    if not link.startswith("http"):
+        return True
+    client = get_http_client()
+    try:
+        resp = await client.head(link, timeout=PROBE_TIMEOUT)
+        if resp.status_code in (405, 501):
+            # Some hosts refuse HEAD; ask for a single byte instead
+            resp = await client.get(link, headers={"Range": "bytes=0-0"}, timeout=PROBE_TIMEOUT)
+        return resp.status_code < 400
+    except Exception as e:
+        logger.debug(f"Probe failed for {link}: {e}")
+        return False
+
+
+class ResolvedLinkCache:
+    """
+    episode URL + sub/dub variant -> resolved direct link.
+    Memory -> Mongo (per-document expiry) -> resolver; concurrent resolves
+    of the same episode share one browser run.
+    """
+
+    def __init__(self):
+        self.memory = TTLCache(maxsize=512)
+        self._inflight = {}
+
+    @staticmethod
+    def make_key(episode_url, variant):
+        return f"{episode_url}|{variant or 'default'}"
+
+    async def get(self, episode_url, variant):
+        key = self.make_key(episode_url, variant)
+
+        entry, _ = self.memory.get(key)
+        if entry is None:
+            doc = await db.get_resolved_link(key)
+            if doc:
+                left = (doc["expires_at"] - datetime.utcnow()).total_seconds()
+                entry = (doc["link"], time.time() + left)
+        if entry is None:
+            return None
+
+        link, expires = entry
+        if expires < time.time() or not await probe_link(link):
+            await self.invalidate(episode_url, variant)
+            return None
+
+        self.memory.set(key, entry)
+        return link
+
+    async def put(self, episode_url, variant, link):
+        key = self.make_key(episode_url, variant)
+        ttl = link_ttl(link)
+        self.memory.set(key, (link, time.time() + ttl))
+        await db.set_resolved_link(key, link, datetime.utcnow() + timedelta(seconds=ttl))
+
+    async def invalidate(self, episode_url, variant):
+        key = self.make_key(episode_url, variant)
+        self.memory.pop(key)
+        await db.delete_resolved_link(key)
+
+    async def resolve(self, episode_url, variant, resolver):
+        """
+        Cached link if it still answers, otherwise run `resolver()` once
+        (shared by everyone asking for the same episode) and cache the result.
+        """
+        link = await self.get(episode_url, variant)
+        if link:
+            logger.info(f"Link cache hit: {episode_url} ({variant})")
+            return link
+
+        key = self.make_key(episode_url, variant)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._resolve(episode_url, variant, resolver))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _resolve(self, episode_url, variant, resolver):
+        try:
+            link = await resolver()
+        except Exception as e:
+            logger.error(f"Automation failed for {episode_url}: {e}")
+            return None
+        if link:
+            await self.put(episode_url, variant, link)
+        return link
+
+
+link_cache = ResolvedLinkCache()
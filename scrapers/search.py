@@ -0,0 +1,201 @@
+# search.py
+import asyncio
+import re
+import time
+import logging
+from datetime import datetime
+from database.mongo import db
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SEARCH_DEADLINE = 30         # hard cap for the whole fan-out
+MERGE_WINDOW = 12            # "merge" mode: collect whatever lands by then
+SLOW_SOURCE_SECONDS = 15     # sources slower than this get flagged in logs
+
+CACHE_FRESH_SECONDS = 10 * 60      # served as-is
+CACHE_STALE_SECONDS = 24 * 3600    # served instantly, refreshed in background
+CACHE_MEMORY_ENTRIES = 256
+
+
+class SearchOrchestrator:
+    """
+    Runs every search source at the same time under one deadline.
+    - mode="first": first non-empty answer wins, the rest are cancelled
+    - mode="merge": merge + dedupe everything that returns within the window
+    Per-source latency is kept in `self.timings` after each run.
+    """
+
+    def __init__(self, sources, mode="first", deadline=SEARCH_DEADLINE, merge_window=MERGE_WINDOW):
+        # sources: list of (name, coroutine)
+        self.sources = sources
+        self.mode = mode
+        self.deadline = deadline
+        self.merge_window = min(merge_window, deadline)
+        self.timings = {}
+
+    async def run(self):
+        started = time.monotonic()
+        tasks = {}
+        for name, coro in self.sources:
+            task = asyncio.create_task(self._timed(name, coro, started))
+            tasks[task] = name
+
+        try:
+            if self.mode == "merge":
+                results = await self._merge(tasks)
+            else:
+                results = await self._first(tasks, started)
+        finally:
+            for task, name in tasks.items():
+                if not task.done():
+                    task.cancel()
+                    self.timings.setdefault(name, {
+                        "seconds": round(time.monotonic() - started, 2),
+                        "count": 0,
+                        "status": "cancelled"
+                    })
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self._report()
+        return results
+
+    # -------------------------
+    # Modes
+    # -------------------------
+
+    async def _first(self, tasks, started):
+        pending = set(tasks)
+        while pending:
+            remaining = self.deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                res = task.result()
+                if res:
+                    logger.info(f"Scraper '{tasks[task]}' succeeded.")
+                    return res
+        return []
+
+    async def _merge(self, tasks):
+        done, _ = await asyncio.wait(set(tasks), timeout=self.merge_window)
+
+        # Keep source priority order, not completion order
+        merged, seen = [], set()
+        for task, name in tasks.items():
+            if task not in done:
+                continue
+            for item in task.result() or []:
+                key = (item.get("url") or item.get("title", "")).rstrip("/").lower()
+                if key and key not in seen:
+                    seen.add(key)
+                    merged.append(item)
+        return merged
+
+    # -------------------------
+    # Instrumentation
+    # -------------------------
+
+    async def _timed(self, name, coro, started):
+        try:
+            res = await coro
+            self.timings[name] = {
+                "seconds": round(time.monotonic() - started, 2),
+                "count": len(res or []),
+                "status": "ok" if res else "empty"
+            }
+            return res or []
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Search source '{name}' failed: {e}")
+            self.timings[name] = {
+                "seconds": round(time.monotonic() - started, 2),
+                "count": 0,
+                "status": "error"
+            }
+            return []
+
+    def _report(self):
+        summary = ", ".join(
+            f"{name}={t['seconds']}s/{t['status']}({t['count']})"
+            for name, t in self.timings.items()
+        )
+        # WARNING like the other operational reports: the root logger drops INFO
+        logger.warning(f"⏱️ Search timings: {summary}")
+
+        slow = [n for n, t in self.timings.items()
+                if t["seconds"] > SLOW_SOURCE_SECONDS and t["status"] != "cancelled"]
+        if slow:
+            logger.warning(f"🐢 Slow search sources: {', '.join(slow)}")
+
+
+# =========================
+# QUERY RESULT CACHE
+# =========================
+
+def normalize_query(query):
+    """'  Naruto:  Shippuden ' -> 'naruto shippuden'"""
+    query = re.sub(r"[^\w\s]", " ", query.lower())
+    return " ".join(query.split())
+
+
+class SearchCache:
+    """
+    Two-tier /search cache (memory LRU -> Mongo) with stale-while-revalidate.
+    Fresh hits return directly; stale hits return directly AND kick off a
+    single background refresh; misses run the fetcher inline.
+    """
+
+    def __init__(self, fresh=CACHE_FRESH_SECONDS, stale=CACHE_STALE_SECONDS):
+        self.fresh = fresh
+        self.stale = stale
+        self.memory = TTLCache(maxsize=CACHE_MEMORY_ENTRIES, max_age=stale)
+        self._refreshing = {}   # key -> background task
+
+    async def get_or_fetch(self, query, fetcher):
+        """fetcher: zero-arg callable returning a coroutine that yields results."""
+        key = normalize_query(query)
+        if not key:
+            return await fetcher()
+
+        results, age = self.memory.get(key)
+        if results is None:
+            results, age = await self._load(key)
+
+        if results is None:
+            return await self._refresh(key, fetcher)
+
+        if age > self.fresh and key not in self._refreshing:
+            task = asyncio.create_task(self._refresh(key, fetcher))
+            self._refreshing[key] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+        return results
+
+    async def _load(self, key):
+        doc = await db.get_search_cache(key)
+        if not doc or not doc.get("results"):
+            return None, None
+
+        age = (datetime.utcnow() - doc["updated_at"]).total_seconds()
+        if age > self.stale:
+            return None, None
+        self.memory.set(key, doc["results"], stored_at=time.time() - age)
+        return doc["results"], age
+
+    async def _refresh(self, key, fetcher):
+        try:
+            results = await fetcher()
+        except Exception as e:
+            logger.error(f"Search refresh failed for '{key}': {e}")
+            return []
+
+        # Never cache a blank answer; a site outage shouldn't stick for a day
+        if results:
+            self.memory.set(key, results)
+            await db.set_search_cache(key, results)
+        return results
+
+
+search_cache = SearchCache()
@@ -0,0 +1,129 @@
+# site_health.py
+import time
+import random
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 20                # outcomes kept per site
+TRIP_AFTER = 3             # consecutive hard failures before the breaker opens
+COOLDOWN = 5 * 60          # first open period; doubles on every failed half-open probe
+MAX_COOLDOWN = 30 * 60
+DEFAULT_LATENCY = 5.0      # optimistic guess for sites we have not measured yet
+PROBE_TIMEOUT = 60         # half-open probe that never reported back is released
+
+
+class SiteHealth:
+    """Rolling success rate / latency + a circuit breaker for one site."""
+
+    def __init__(self, name):
+        self.name = name
+        self.outcomes = deque(maxlen=WINDOW)    # (ok, seconds)
+        self.failures = 0                       # consecutive hard failures
+        self.last_block = None                  # time of last 403/503
+        self.opened_at = None
+        self.cooldown = COOLDOWN
+        self.probing_since = None
+
+    # -------------------------
+    # Stats
+    # -------------------------
+
+    def success_rate(self):
+        if not self.outcomes:
+            return 1.0
+        return sum(1 for ok, _ in self.outcomes if ok) / len(self.outcomes)
+
+    def percentile(self, pct):
+        lat = sorted(s for _, s in self.outcomes)
+        if not lat:
+            return DEFAULT_LATENCY
+        return lat[min(len(lat) - 1, int(len(lat) * pct))]
+
+    def payoff(self):
+        # Results per second we expect from trying this site next
+        return self.success_rate() / max(self.percentile(0.5), 0.1)
+
+    # -------------------------
+    # Circuit Breaker
+    # -------------------------
+
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        state = self.state()
+        if state == "closed":
+            return True
+        # Exactly one trial request; a probe that never reported back expires
+        if state == "half-open" and (self.probing_since is None or time.time() - self.probing_since > PROBE_TIMEOUT):
+            self.probing_since = time.time()
+            return True
+        return False
+
+    def record(self, outcome, seconds, status=None):
+        """outcome: "ok" | "empty" | "blocked" | "error" | "timeout" """
+        self.outcomes.append((outcome == "ok", seconds))
+        if outcome == "timeout":
+            # Cancelled once others had answered: slow, not broken -> no breaker strike
+            self.probing_since = None
+            return
+        if status in (403, 503) or outcome == "blocked":
+            self.last_block = time.time()
+
+        if outcome in ("ok", "empty"):
+            # The site answered; an empty list just means no match
+            if self.opened_at is not None:
+                logger.warning(f"✅ {self.name} recovered, closing breaker")
+            self.failures = 0
+            self.opened_at = None
+            self.cooldown = COOLDOWN
+        else:
+            self.failures += 1
+            if self.probing_since is not None:
+                self.cooldown = min(self.cooldown * 2, MAX_COOLDOWN)
+                self.opened_at = time.time()
+            elif self.failures >= TRIP_AFTER and self.opened_at is None:
+                logger.warning(f"⛔ {self.name} tripped after {self.failures} failures")
+                self.opened_at = time.time()
+        self.probing_since = None
+
+    def snapshot(self):
+        return {
+            "success_rate": round(self.success_rate() * 100),
+            "p50": round(self.percentile(0.5), 1),
+            "p95": round(self.percentile(0.95), 1),
+            "since_block": None if self.last_block is None else int(time.time() - self.last_block),
+            "state": self.state(),
+            "samples": len(self.outcomes)
+        }
+
+
+class SiteHealthRegistry:
+    def __init__(self):
+        self._sites = {}
+
+    def get(self, name):
+        if name not in self._sites:
+            self._sites[name] = SiteHealth(name)
+        return self._sites[name]
+
+    def order(self, sites):
+        """Sites worth trying, best expected payoff first (breakers respected)."""
+        allowed = [s for s in sites if self.get(s["name"]).allow()]
+        # Small jitter keeps ties from always hitting the same site (avoid detection)
+        return sorted(allowed, key=lambda s: self.get(s["name"]).payoff() * random.uniform(0.9, 1.1), reverse=True)
+
+    def record(self, name, outcome, seconds, status=None):
+        self.get(name).record(outcome, seconds, status)
+
+    def snapshot(self):
+        return {name: h.snapshot() for name, h in sorted(self._sites.items())}
+
+
+site_health = SiteHealthRegistry()
@@ -0,0 +1,122 @@
+import re
+import logging
+import weakref
+from urllib.parse import urlsplit
+from database.mongo import db
+
+logger = logging.getLogger(__name__)
+
+# Rough time one anti-bot interstitial costs us (used for the savings estimate)
+CHALLENGE_PENALTY = 5.0
+
+
+def site_key(host):
+    """'www.hianime.to' / '.hianime.to' -> 'hianime.to'"""
+    labels = (host or "").lower().strip(".").split(".")
+    return ".".join(labels[-2:])
+
+
+class SessionStore:
+    """
+    Per-site browser storage-state (cookies incl. cf_clearance + localStorage).
+    - Snapshots are taken when a context is recycled / shut down
+    - New contexts start from the merged snapshots
+    - A site that challenges us again gets its snapshot dropped
+    - cf_clearance is bound to the User-Agent, so the UA is saved with the
+      snapshots and every context reuses it (user_agent())
+    """
+
+    def __init__(self):
+        self._states = {}     # site -> {"cookies": [...], "origins": [...]}
+        self._loaded = False
+        self._ua = None
+        self._visited = set()
+        self._counted = weakref.WeakKeyDictionary()   # context -> sites already counted
+
+        self.reused = 0       # navigations that passed thanks to a saved session
+        self.challenges = 0   # saved sessions that got challenged anyway
+
+    async def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        docs = await db.get_browser_states()
+        for doc in docs:
+            self._states[doc["site"]] = {"cookies": doc.get("cookies", []), "origins": doc.get("origins", [])}
+        # The UA the newest snapshots were taken with
+        saved = sorted((d for d in docs if d.get("user_agent")), key=lambda d: d.get("updated_at") or 0)
+        if saved and not self._ua:
+            self._ua = saved[-1]["user_agent"]
+
+    async def user_agent(self, pick):
+        """The UA pinned for the life of the store (`pick()` chooses one if none was saved)."""
+        await self._load()
+        if not self._ua:
+            self._ua = pick()
+        return self._ua
+
+    async def storage_state(self):
+        """Merged snapshot for browser.new_context(storage_state=...)."""
+        await self._load()
+
+        return {
+            "cookies": [c for s in self._states.values() for c in s["cookies"]],
+            "origins": [o for s in self._states.values() for o in s["origins"]]
+        }
+
+    def observe(self, context, url, status, headers):
+        """
+        Called for every main-frame navigation response.
+        Returns the site key if it looks like an anti-bot challenge, else None.
+        """
+        site = site_key(urlsplit(url).hostname)
+        if not site:
+            return None
+        self._visited.add(site)
+
+        challenged = status in (403, 503) or headers.get("cf-mitigated") == "challenge"
+        if challenged:
+            if site in self._states:
+                self.challenges += 1
+            return site
+
+        counted = self._counted.setdefault(context, set())
+        if site in self._states and site not in counted:
+            counted.add(site)
+            self.reused += 1
+        return None
+
+    async def forget(self, context, site):
+        """Saved session no longer works -> drop it everywhere."""
+        if self._states.pop(site, None) is not None:
+            logger.warning(f"🍪 Session for {site} expired (challenged again)")
+            await db.delete_browser_state(site)
+        try:
+            await context.clear_cookies(domain=re.compile(rf"(^|\.){re.escape(site)}$"))
+        except Exception:
+            pass
+
+    async def save(self, context):
+        try:
+            state = await context.storage_state()
+        except Exception:
+            return   # context already dead
+
+        for site in list(self._visited):
+            cookies = [c for c in state.get("cookies", []) if site_key(c.get("domain")) == site]
+            origins = [o for o in state.get("origins", []) if site_key(urlsplit(o.get("origin", "")).hostname) == site]
+            if not cookies and not origins:
+                continue
+            self._states[site] = {"cookies": cookies, "origins": origins}
+            await db.set_browser_state(site, cookies, origins, self._ua)
+
+    def snapshot(self):
+        return {
+            "sites": len(self._states),
+            "reused": self.reused,
+            "challenges": self.challenges,
+            "est_seconds_saved": round(self.reused * CHALLENGE_PENALTY, 1)
+        }
+
+
+session_store = SessionStore()
@@ -0,0 +1,45 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Small in-memory LRU with per-entry freshness.
+    get() returns (value, age_seconds) so callers can decide what "stale" means.
+    """
+
+    def __init__(self, maxsize=256, max_age=None):
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None, None
+
+        value, stored_at = item
+        age = time.time() - stored_at
+        if self.max_age is not None and age > self.max_age:
+            del self._data[key]
+            self.misses += 1
+            return None, None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value, age
+
+    def set(self, key, value, stored_at=None):
+        self._data[key] = (value, stored_at or time.time())
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        return self._data.pop(key, (None, None))[0]
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,38 @@
+import logging
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+# One pooled HTTP/2 client for the whole process (sockets + TLS sessions reused)
+_CLIENT = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        _CLIENT = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            headers=DEFAULT_HEADERS,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=20,
+                max_keepalive_connections=10,
+                keepalive_expiry=60
+            )
+        )
+    return _CLIENT
+
+async def close_http_client():
+    global _CLIENT
+    if _CLIENT is not None and not _CLIENT.is_closed:
+        try:
+            await _CLIENT.aclose()
+        except Exception as e:
+            logger.warning(f"HTTP client close failed: {e}")
+    _CLIENT = None
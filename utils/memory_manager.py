@@ -5,9 +5,17 @@ import asyncio
 import logging
 import time
 import signal
+from utils.safe_browser import MAX_BROWSER_LIFETIME, MAX_CONCURRENT_PAGES
+from utils.process_registry import process_registry
 
 logger = logging.getLogger(__name__)
 
+# Shared by MemoryManager and browser_tab_budget()
+TOTAL_MEM_LIMIT = 512 * 1024 * 1024
+SAFE_MEM_RATIO = 0.70
+TAB_COST = 80 * 1024 * 1024   # rough RSS of one extra Chromium tab
+MAX_PAUSED = 300              # a paused mux still stuck at critical after this is killed
+
 class MemoryManager:
     def __init__(self):
         self.running = False
@@ -16,13 +24,13 @@ class MemoryManager:
         # We assume 512MB Total. We start cleaning at ~350MB to be safe.
         # If we rely on psutil.virtual_memory().total, it will report the SERVER'S 64GB RAM,
         # causing the bot to think it has infinite memory -> OOM Crash.
-        self.total_mem_limit = 512 * 1024 * 1024
+        self.total_mem_limit = TOTAL_MEM_LIMIT
         
         # Thresholds:
         # Safe (70%): Trigger Python Garbage Collection
-        self.safe_limit = self.total_mem_limit * 0.70     # ~358 MB
+        self.safe_limit = self.total_mem_limit * SAFE_MEM_RATIO     # ~358 MB
         
-        # Critical (85%): Kill heavy sub-processes (Chrome/FFmpeg)
+        # Critical (85%): Kill Chrome, pause our FFmpeg jobs
         self.critical_limit = self.total_mem_limit * 0.85 # ~435 MB
         
         logger.warning(f"🧠 Memory Governance: Active (Limit={self.total_mem_limit/1024**2:.0f}MB)")
@@ -41,26 +49,35 @@ class MemoryManager:
 
     async def health_check(self):
         try:
-            import psutil
-            process = psutil.Process(os.getpid())
-            mem_usage = process.memory_info().rss
+            # Whole container (cgroup) or process-tree PSS: the ffmpeg we pause must show up
+            # in the number that decides whether to pause / resume it
+            mem_usage = used_memory()
             
             # 1. Light Cleanup (Always run if getting full)
             if mem_usage > self.safe_limit:
                 gc.collect()
+            else:
+                # Back under the safe line: paused muxes carry on where they stopped
+                process_registry.resume_all()
 
             # 2. Critical Cleanup (Kill Heavy Processes)
             # If we are close to the 512MB cliff, kill the heaviest process immediately.
+            # Our own ffmpeg jobs are only paused (SIGSTOP), so no finished work is lost.
+            # A stopped process keeps its RSS: pausing stops growth, it frees nothing,
+            # hence kill_paused() once memory stays critical for MAX_PAUSED.
             if mem_usage > self.critical_limit:
-                logger.warning(f"🚨 RAM CRITICAL ({mem_usage/1024**2:.1f}MB)! Killing Chrome/FFmpeg...")
+                logger.warning(f"🚨 RAM CRITICAL ({mem_usage/1024**2:.1f}MB)! Killing Chrome, pausing FFmpeg...")
                 self.kill_process_by_name("chrome")
-                self.kill_process_by_name("ffmpeg")
+                process_registry.pause_all()
+                process_registry.kill_paused(MAX_PAUSED)
+                self.kill_process_by_name("ffmpeg", keep=process_registry.pids())
                 # Force a hard collection after killing
                 gc.collect()
                 
             # 3. Zombie Hunter (Stuck Scrapers)
-            # Kill any chrome process older than 2 minutes (scrapers should be fast now)
-            self.kill_zombies("chrome", max_age_seconds=120) 
+            # The pooled browser recycles itself every MAX_BROWSER_LIFETIME,
+            # so anything older than that (plus grace) was leaked.
+            self.kill_zombies("chrome", max_age_seconds=MAX_BROWSER_LIFETIME + 120)
             
             # 4. Disk Hygiene
             self.clean_stuck_downloads()
@@ -68,12 +85,12 @@ class MemoryManager:
         except Exception as e:
             logger.error(f"Health Check Failed: {e}")
 
-    def kill_process_by_name(self, name):
-        """Kills any process matching the name (e.g., 'chrome')."""
+    def kill_process_by_name(self, name, keep=()):
+        """Kills any process matching the name (e.g., 'chrome'), except the PIDs in keep."""
         import psutil
         for proc in psutil.process_iter(['pid', 'name']):
             try:
-                if name.lower() in proc.info['name'].lower():
+                if name.lower() in proc.info['name'].lower() and proc.info['pid'] not in keep:
                     proc.kill()
             except (psutil.NoSuchProcess, psutil.AccessDenied):
                 pass
@@ -98,15 +115,80 @@ class MemoryManager:
             current_time = time.time()
             for f in os.listdir(download_path):
                 f_path = os.path.join(download_path, f)
+                # aria2's resume state, not a leftover
+                if f == "aria2.session": continue
                 try:
-                    # Delete files older than 3 hours (10800 seconds)
-                    if os.stat(f_path).st_mtime < (current_time - 10800):
+                    # Delete files older than 3 hours (10800 seconds); a pack
+                    # folder counts as old only if nothing inside is still written
+                    if newest_mtime(f_path) < (current_time - 10800):
                         if os.path.isfile(f_path): os.remove(f_path)
                         elif os.path.isdir(f_path): shutil.rmtree(f_path)
                         logger.warning(f"♻️ Cleaned junk: {f}")
                 except Exception:
                     pass
 
+def newest_mtime(path):
+    if not os.path.isdir(path):
+        return os.stat(path).st_mtime
+    newest = os.stat(path).st_mtime
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                newest = max(newest, os.stat(os.path.join(root, name)).st_mtime)
+            except OSError:
+                pass
+    return newest
+
+CGROUP_FILES = (
+    # (usage, stat file, reclaimable page-cache key): cgroup v2, then v1
+    ("/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory.stat", "inactive_file"),
+    ("/sys/fs/cgroup/memory/memory.usage_in_bytes", "/sys/fs/cgroup/memory/memory.stat", "total_inactive_file"),
+)
+
+def _cgroup_memory():
+    """What the container is charged for, minus page cache the kernel can drop (like `docker stats`)."""
+    for usage_path, stat_path, key in CGROUP_FILES:
+        try:
+            with open(usage_path) as f:
+                usage = int(f.read())
+            with open(stat_path) as f:
+                stats = dict(line.split() for line in f if line.strip())
+            return max(0, usage - int(stats.get(key, 0)))
+        except (OSError, ValueError):
+            continue
+    return None
+
+def used_memory():
+    """
+    Memory of the bot plus its children (Playwright driver, Chromium, ffmpeg).
+    Summing RSS counts Chromium's shared pages once per renderer/zygote, so:
+    the container's cgroup usage, else the PSS of the process tree.
+    """
+    cgroup = _cgroup_memory()
+    if cgroup is not None:
+        return cgroup
+
+    import psutil
+    proc = psutil.Process(os.getpid())
+    total = 0
+    for p in [proc] + proc.children(recursive=True):
+        try:
+            try:
+                total += p.memory_full_info().pss
+            except (psutil.AccessDenied, AttributeError):
+                total += p.memory_info().rss   # no PSS on this platform / permission
+        except psutil.NoSuchProcess:
+            pass
+    return total
+
+def browser_tab_budget(max_tabs=MAX_CONCURRENT_PAGES):
+    """How many tabs one query may open right now without crossing the safe limit."""
+    try:
+        free = TOTAL_MEM_LIMIT * SAFE_MEM_RATIO - used_memory()
+    except Exception:
+        return 1
+    return max(1, min(max_tabs, int(free // TAB_COST)))
+
 # Entry point
 async def start_memory_manager():
     manager = MemoryManager()
@@ -0,0 +1,76 @@
+import os
+import time
+import signal
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessRegistry:
+    """
+    PIDs of the ffmpeg jobs we started, so the memory governor can pause
+    (SIGSTOP) and later resume them instead of killing half-done work,
+    and so a cancel button can stop the ones belonging to its download.
+    """
+
+    def __init__(self):
+        self.procs = {}      # pid -> {"label", "key", "paused_at"}
+
+    def register(self, pid, label="", key=None):
+        self.procs[pid] = {"label": label, "key": key, "paused_at": None, "cancelled": False}
+
+    def unregister(self, pid):
+        self.procs.pop(pid, None)
+
+    def pids(self):
+        return set(self.procs)
+
+    def was_cancelled(self, pid):
+        return bool(self.procs.get(pid, {}).get("cancelled"))
+
+    def cancel(self, key):
+        """Kill every process started for `key` (e.g. a download GID). Returns how many."""
+        killed = 0
+        for pid, info in list(self.procs.items()):
+            if key is not None and info["key"] == key:
+                info["cancelled"] = True
+                if self._signal(pid, signal.SIGKILL):
+                    killed += 1
+        return killed
+
+    def pause_all(self):
+        paused = 0
+        for pid, info in list(self.procs.items()):
+            if info["paused_at"] is None and self._signal(pid, signal.SIGSTOP):
+                info["paused_at"] = time.time()
+                paused += 1
+                logger.warning(f"⏸️ Paused {info['label']} (pid {pid})")
+        return paused
+
+    def resume_all(self):
+        resumed = 0
+        for pid, info in list(self.procs.items()):
+            if info["paused_at"] is not None and self._signal(pid, signal.SIGCONT):
+                info["paused_at"] = None
+                resumed += 1
+                logger.warning(f"▶️ Resumed {info['label']} (pid {pid})")
+        return resumed
+
+    def kill_paused(self, max_paused):
+        """Last resort: jobs paused this long while memory stayed critical."""
+        for pid, info in list(self.procs.items()):
+            if info["paused_at"] and time.time() - info["paused_at"] > max_paused:
+                logger.warning(f"🔪 Killed {info['label']} (paused {int(time.time() - info['paused_at'])}s)")
+                self._signal(pid, signal.SIGKILL)
+                self._signal(pid, signal.SIGCONT)
+
+    def _signal(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+            return True
+        except (ProcessLookupError, PermissionError):
+            self.procs.pop(pid, None)
+            return False
+
+
+process_registry = ProcessRegistry()